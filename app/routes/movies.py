@@ -1,12 +1,21 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from time import monotonic
+
 from flask import Blueprint, jsonify, request
 
 from app.services import tmdb_service
+from app.services.config import MOVIE_DETAIL_DEADLINE
 from app.services.html_service import search_torrents
 from app.services.tmdb_service import get_popular_bluray_movies, get_trending_movies, get_movie_watchlist, \
     get_top_rated_movies, search_movies_by_name, advanced_search
 
 movies_bp = Blueprint("movies", __name__, url_prefix="")
 
+# Torrent searches outlive the detail deadline, they get their own pool so TMDB details calls (on the TMDB pool)
+# never queue behind abandoned searches
+torrent_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='movie-torrents')
+
 
 @movies_bp.route("/api/movies", methods=["GET"])
 def get_movies():
@@ -37,35 +46,75 @@ def get_movies():
 
 @movies_bp.route("/api/movie/<int:movie_id>", methods=["GET"])
 def movie_detail(movie_id):
-    movie_data = tmdb_service.get_movie_details(movie_id)
+    deadline = monotonic() + MOVIE_DETAIL_DEADLINE
+
+    # Start the torrent search right away when the title is already known from a listing
+    torrents_query, torrents_future = None, None
+    known_title = tmdb_service.peek_movie_title(movie_id)
+    if known_title:
+        torrents_query = torrent_query(*known_title)
+        torrents_future = torrent_search_executor.submit(search_torrents, torrents_query)
+
+    # Credits come in the same call as the details, which wait under the same deadline as the torrent search
+    details_future = tmdb_service.tmdb_executor.submit(tmdb_service.get_movie_details, movie_id, with_credits=True)
+    timed_out = []
+    try:
+        movie_data = details_future.result(timeout=max(0.0, deadline - monotonic()))
+    except FutureTimeoutError:
+        logging.warning(f"TMDB details of movie {movie_id} missed the movie detail deadline")
+        movie_data = None
+        timed_out.append('details')
+
+    movie, query = None, torrents_query
+    if movie_data is not None:
+        genres = [genre['name'] for genre in movie_data.get('genres', [])]
+        genre_string = ', '.join(genres)
 
-    genres = [genre['name'] for genre in movie_data.get('genres', [])]
-    genre_string = ', '.join(genres)
+        credits_data = movie_data.get('credits', {})
+        cast = [member['name'] for member in credits_data.get('cast', [])[:5]]
+        cast_string = ', '.join(cast)
 
-    credits_data = tmdb_service.get_movie_credits(movie_id)
-    cast = [member['name'] for member in credits_data.get('cast', [])[:5]]
-    cast_string = ', '.join(cast)
+        vote_average = movie_data.get('vote_average', 0)
+        user_score_percentage = round(vote_average * 10)
 
-    vote_average = movie_data.get('vote_average', 0)
-    user_score_percentage = round(vote_average * 10)
+        movie = {
+            'title': movie_data.get('title'),
+            'release_date': movie_data.get('release_date'),
+            'poster_path': movie_data.get('poster_path'),
+            'overview': movie_data.get('overview'),
+            'genre': genre_string,
+            'cast': cast_string,
+            'user_score_percentage': user_score_percentage
+        }
 
-    movie = {
-        'title': movie_data.get('title'),
-        'release_date': movie_data.get('release_date'),
-        'poster_path': movie_data.get('poster_path'),
-        'overview': movie_data.get('overview'),
-        'genre': genre_string,
-        'cast': cast_string,
-        'user_score_percentage': user_score_percentage
-    }
+        query = torrent_query(movie_data.get('title'), movie_data.get('release_date'))
+        if torrents_future is None or query != torrents_query:
+            torrents_future = torrent_search_executor.submit(search_torrents, query)
+
+    # A torrent search missing the deadline keeps running in the background, the page is answered without it
+    torrents = []
+    if torrents_future is None:
+        # Neither the details nor a listing gave the title in time, there was nothing to search for
+        timed_out.append('torrents')
+    else:
+        try:
+            torrents = torrents_future.result(timeout=max(0.0, deadline - monotonic()))
+        except FutureTimeoutError:
+            logging.warning(f"Torrent search for '{query}' missed the movie detail deadline")
+            timed_out.append('torrents')
 
-    torrents = search_torrents(f"{movie_data.get('title')} {movie_data.get('release_date')[:4]}")
     return jsonify({
         'title': movie,
-        'torrents': torrents
+        'torrents': torrents,
+        'partial': bool(timed_out),
+        'timed_out': timed_out
     })
 
 
+def torrent_query(title, release_date):
+    return f"{title} {(release_date or '')[:4]}"
+
+
 @movies_bp.route("/api/movies/search", methods=["GET"])
 def search_movies():
     query = request.args.get('query', '')
@@ -0,0 +1,30 @@
+from flask import Blueprint, jsonify
+
+from app.services.cache import cache_stats
+from app.services.cache_store import cache_store
+from app.services.ffmpeg_manager import ffmpeg_manager
+from app.services.hls_service import hls_segmenter
+from app.services.indexers import indexer_stats
+from app.services.jellyfin_service import jellyfin_scans
+from app.services.qbittorrent_service import qbittorrent, qbittorrent_mirror
+from app.services.singleflight import flight_stats
+from app.services.stream_service import remux_cache
+
+stats_bp = Blueprint("stats", __name__, url_prefix="")
+
+
+@stats_bp.route("/api/stats", methods=["GET"])
+def get_stats():
+    # Every TTLCache and SingleFlight group registers itself when created, cache_stats and flight_stats report them all
+    return jsonify({
+        'caches': cache_stats(),
+        'store': cache_store.stats(),
+        'single_flight': flight_stats(),
+        'indexers': indexer_stats(),
+        'qbittorrent': qbittorrent.stats(),
+        'qbittorrent_mirror': qbittorrent_mirror.stats(),
+        'jellyfin_scans': jellyfin_scans.stats(),
+        'remux_cache': remux_cache.stats(),
+        'hls': hls_segmenter.stats(),
+        'ffmpeg': ffmpeg_manager.stats()
+    })
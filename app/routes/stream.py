@@ -1,9 +1,16 @@
+import logging
+import os
 import re
+import subprocess
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, send_file, Response
 
 from app.services.config import DOWNLOADS_BASE_PATH
-from app.services.stream_service import find_media_files, stream_and_remux, stream_mp4
+from app.services.hls_service import hls_segmenter, probe_media, build_playlist, load_media
+from app.services.media_response import send_media
+from app.services.stream_service import find_media_files, stream_and_remux, stream_mp4, stream_cached_remux, \
+    remux_cache
+from app.services.torrent_stream import locate_downloading_file
 from app.services.utils import is_windows
 
 stream_bp = Blueprint("stream", __name__, url_prefix="")
@@ -31,14 +38,56 @@ def title_exists():
 
 @stream_bp.route('/stream/<string:torrent_title>')
 def stream(torrent_title):
+    # Files of torrents still downloading are only read where qBittorrent has the pieces
+    torrent_file = locate_downloading_file(request.args.get('file'))
     if request.args.get('file').lower().endswith(".mkv"):
-        return stream_and_remux(torrent_title)
+        # `mode=pipe` keeps the uncached remux piped straight from ffmpeg (no seeking)
+        if remux_cache.enabled() and request.args.get('mode') != 'pipe' and torrent_file is None:
+            return stream_cached_remux(torrent_title)
+        return stream_and_remux(torrent_title, torrent_file)
     elif request.args.get('file').lower().endswith(".mp4"):
-        return stream_mp4(torrent_title)
+        return stream_mp4(torrent_title, torrent_file)
     else:
         return "Bad file type", 400
 
 
+@stream_bp.route('/hls/playlist.m3u8')
+def hls_playlist():
+    """HLS playlist of `file`, its segments are produced on demand when the player requests them."""
+    media_file_path = request.args.get('file')
+    if not media_file_path or not os.path.exists(media_file_path):
+        return "File not found", 404
+
+    try:
+        media = probe_media(media_file_path)
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError) as e:
+        logging.error(f"ffprobe failed for {media_file_path}: {e}")
+        return "Failed to read media file", 500
+    if media is None:
+        # The keyframe scan of a large file is still running in the background
+        return Response("Media is being indexed, try again shortly", 503, headers={'Retry-After': '2'})
+
+    # Relative URIs resolve to /hls/<key>/<index>.ts
+    playlist = build_playlist(media, lambda index: f"{media['key']}/{index}.ts")
+    return Response(playlist, mimetype='application/vnd.apple.mpegurl', headers={'Cache-Control': 'no-cache'})
+
+
+@stream_bp.route('/hls/<string:key>/<int:index>.ts')
+def hls_segment(key, index):
+    media = load_media(key)
+    if media is None or index >= len(media['segments']):
+        return "Segment not found", 404
+
+    try:
+        segment_path = hls_segmenter.segment(media, index)
+    except OSError as e:
+        logging.error(f"ffmpeg process failed: {e}")
+        return "FFmpeg not found. Please ensure FFmpeg is installed and accessible.", 500
+    if segment_path is None:
+        return Response("Segment is not ready yet", 503, headers={'Retry-After': '1'})
+    return send_media(segment_path, 'video/mp2t', max_age=24 * 60 * 60)
+
+
 @stream_bp.route('/subtitle')
 def fetch_subtitles():
     subtitle_path = request.args.get('path')
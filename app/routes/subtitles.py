@@ -2,7 +2,6 @@ import logging
 import os
 import re
 import shutil
-import threading
 import zipfile
 
 import requests
@@ -10,7 +9,7 @@ from flask import Blueprint, jsonify, request, Response, stream_with_context
 
 from app.services import config
 from app.services.config import WIZDOM_DOMAIN, SUBS_DIR, DOWNLOADS_BASE_PATH
-from app.services.jellyfin_service import notify_jellyfin
+from app.services.jellyfin_service import jellyfin_scans
 from app.services.subtitle_service import search_by_imdb, convert_srt_to_vtt, sync_with_ffsubsync, \
     sync_with_fixed_offset
 from app.services.tmdb_service import search_tmdb
@@ -84,8 +83,8 @@ def download_subtitle(sub_id, name):
         # Cleanup ZIP file
         os.remove(zip_filepath)
 
-        # Notify Jellyfin (asynchronously)
-        threading.Timer(10, lambda: notify_jellyfin()).start()
+        # Notify Jellyfin (debounced with the other scan requests)
+        jellyfin_scans.request_scan(f"subtitle downloaded for {media_file_name}")
 
         return jsonify({
             "success": True,
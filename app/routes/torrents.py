@@ -1,13 +1,19 @@
+import json
+import queue
 import re
 
-import requests
-from app.services.html_service import fetch_magnet_link, search_torrents
-from app.services.qbittorrent_service import add_torrent_to_qbittorrent
-from flask import Blueprint, jsonify, request
+from app.services.config import TORRENT_BATCH_MAX_ITEMS
+from app.services.html_service import fetch_magnet_link, fetch_magnet_links, search_torrents, iter_search_events, \
+    select_torrents
+from app.services.qbittorrent_mirror import PROGRESS_FIELDS
+from app.services.qbittorrent_service import add_torrent_to_qbittorrent, add_magnets_to_qbittorrent, qbittorrent, \
+    qbittorrent_mirror, find_torrent_hash
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 
 torrents_bp = Blueprint("torrents", __name__, url_prefix="")
 
-qtorrent_session = requests.session()
+# Seconds between SSE comments keeping idle progress streams open through proxies
+PROGRESS_KEEPALIVE = 15
 
 
 @torrents_bp.route("/api/get_magnet_link", methods=["POST"])
@@ -27,6 +33,59 @@ def get_magnet_link():
         return jsonify({'success': False, 'error': 'Failed to fetch magnet link'})
 
 
+@torrents_bp.route("/api/torrents/batch", methods=["POST"])
+def add_torrents_batch():
+    """
+    Adds several torrents at once, e.g. every episode of a season.
+    Body: `{"context": ..., "title": ..., "torrents": [{"torrent_url": ..., "title": ...}, ...]}`,
+    an item's `title` overrides the batch title and items may also be plain url or magnet strings.
+    Magnets are resolved concurrently and every save folder gets a single qBittorrent add call.
+    """
+    data = request.get_json(silent=True) or {}
+    context = data.get('context')
+    items = data.get('torrents')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'No torrents provided'}), 400
+    if len(items) > TORRENT_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'At most {TORRENT_BATCH_MAX_ITEMS} torrents per batch'}), 400
+
+    entries = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'torrent_url': item}
+        elif not isinstance(item, dict):
+            item = {}
+        title = item.get('title') or data.get('title')
+        if not isinstance(item.get('torrent_url') or '', str) or not isinstance(title or '', str):
+            return jsonify({'success': False, 'error': 'torrent_url and title must be strings'}), 400
+        entries.append({'torrent_url': item.get('torrent_url'),
+                        'title': re.sub(r'[<>:"/\\|?*]', '', title) if title else None})
+
+    magnet_links = fetch_magnet_links(entry['torrent_url'] for entry in entries if entry['torrent_url'])
+
+    folders = {}
+    results = []
+    for entry in entries:
+        result = {'torrent_url': entry['torrent_url'], 'success': False}
+        results.append(result)
+        if not entry['torrent_url'] or not entry['title']:
+            result['error'] = 'Missing torrent_url or title'
+        elif not magnet_links.get(entry['torrent_url']):
+            result['error'] = 'Failed to fetch magnet link'
+        else:
+            folders.setdefault(entry['title'], []).append((magnet_links[entry['torrent_url']], result))
+
+    for title, folder_items in folders.items():
+        success = add_magnets_to_qbittorrent(list(dict.fromkeys(magnet for magnet, _ in folder_items)), context, title)
+        for _, result in folder_items:
+            result['success'] = success
+            if not success:
+                result['error'] = 'Failed to add torrent to qBittorrent'
+
+    added = sum(1 for result in results if result['success'])
+    return jsonify({'success': added == len(results), 'added': added, 'results': results})
+
+
 @torrents_bp.route("/api/upload_torrent", methods=["POST"])
 def upload_torrent_file():
     torrent_file = request.files.get('torrent_file')
@@ -44,8 +103,137 @@ def upload_torrent_file():
 
 @torrents_bp.route("/api/search_torrents")
 def search_torrents_route():
+    """
+    Optional parameters narrow and order the results server side:
+    `resolution`, `codec`, `source` (comma separated), `hdr` (true/false), `min_seeders`, `max_size_gb`,
+    `season`, `episode`, `sort` (seeders, size, quality, date), `order` (asc/desc),
+    `page` and `page_size` (all results on one page when omitted).
+    """
+    query = request.args.get('query')
+    refresh = request.args.get('refresh', default=False, type=parse_bool)
+    if not query:
+        return jsonify({'torrents': [], 'total': 0, 'page': 1, 'total_pages': 1})
+
+    max_size_gb = request.args.get('max_size_gb', type=float)
+    torrents = select_torrents(
+        search_torrents(query, refresh=refresh),
+        resolutions=parse_csv(request.args.get('resolution')),
+        codecs=parse_csv(request.args.get('codec')),
+        sources=parse_csv(request.args.get('source')),
+        hdr=request.args.get('hdr', type=parse_bool),
+        min_seeders=request.args.get('min_seeders', default=0, type=int),
+        max_size=max_size_gb * 1024 ** 3 if max_size_gb is not None else None,
+        season=request.args.get('season', type=int),
+        episode=request.args.get('episode', type=int),
+        sort=request.args.get('sort', default='seeders'),
+        descending=request.args.get('order', default='desc') != 'asc'
+    )
+
+    total = len(torrents)
+    page = max(request.args.get('page', default=1, type=int), 1)
+    page_size = request.args.get('page_size', default=0, type=int)
+    if page_size > 0:
+        total_pages = max((total + page_size - 1) // page_size, 1)
+        torrents = torrents[(page - 1) * page_size:page * page_size]
+    else:
+        page, total_pages = 1, 1
+
+    return jsonify({'torrents': torrents, 'total': total, 'page': page, 'total_pages': total_pages})
+
+
+def parse_bool(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def parse_csv(value):
+    return {item.strip().lower() for item in value.split(',') if item.strip()} if value else None
+
+
+@torrents_bp.route("/api/search_torrents/stream")
+def stream_search_torrents_route():
+    """Streams search results as NDJSON lines (default) or Server-Sent Events with `format=sse`."""
     query = request.args.get('query')
-    if query:
-        torrents = search_torrents(query)
-        return jsonify({'torrents': torrents})
-    return jsonify({'torrents': []})
+    refresh = request.args.get('refresh', default=False, type=parse_bool)
+    use_sse = request.args.get('format') == 'sse'
+    events = iter_search_events(query, refresh=refresh) if query else iter([{'type': 'done', 'torrents': []}])
+
+    def generate():
+        for event in events:
+            if use_sse:
+                yield sse_event(event['type'], event)
+            else:
+                yield json.dumps(event) + "\n"
+
+    return Response(stream_with_context(generate()),
+                    content_type="text/event-stream" if use_sse else "application/x-ndjson",
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@torrents_bp.route("/api/torrents/progress")
+def torrent_progress_stream():
+    """
+    Server-Sent Events with the download progress of the torrents given by `hash` (comma separated)
+    and/or `title` (repeatable, matched like the library lookups).
+    Sends a `snapshot` event first, then `progress` events holding only the fields that changed.
+    Every client shares the qBittorrent mirror's poller, connecting does not add upstream requests.
+    """
+    if not qbittorrent.configured():
+        return jsonify({'error': 'qBittorrent credentials not set.'}), 400
+
+    hashes = parse_csv(request.args.get('hash')) or set()
+    titles = [title for title in request.args.getlist('title') if title]
+    if not hashes and not titles:
+        return jsonify({'error': 'No hash or title provided.'}), 400
+
+    qbittorrent_mirror.ensure_started()
+    subscription = qbittorrent_mirror.subscribe()
+
+    def resolve_titles():
+        for title in list(titles):
+            torrent_hash = find_torrent_hash(title)
+            if torrent_hash:
+                hashes.add(torrent_hash)
+                titles.remove(title)
+
+    def snapshot():
+        torrents = {}
+        for torrent_hash in hashes:
+            torrent = qbittorrent_mirror.get(torrent_hash)
+            if torrent:
+                torrents[torrent_hash] = {field: torrent[field] for field in PROGRESS_FIELDS if field in torrent}
+        return sse_event('snapshot', {'torrents': torrents, 'unmatched': titles})
+
+    def generate():
+        try:
+            resolve_titles()
+            yield snapshot()
+            while True:
+                try:
+                    delta = subscription.get(timeout=PROGRESS_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if delta.get('resync') or delta['full_update']:
+                    resolve_titles()
+                    yield snapshot()
+                    continue
+                if titles and any('name' in changes for changes in delta['changed'].values()):
+                    resolve_titles()
+                    yield snapshot()
+                    continue
+
+                changed = {torrent_hash: changes for torrent_hash, changes in delta['changed'].items()
+                           if torrent_hash in hashes}
+                removed = [torrent_hash for torrent_hash in delta['removed'] if torrent_hash in hashes]
+                if changed or removed:
+                    yield sse_event('progress', {'torrents': changed, 'removed': removed})
+        finally:
+            qbittorrent_mirror.unsubscribe(subscription)
+
+    return Response(stream_with_context(generate()), content_type="text/event-stream",
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def sse_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
@@ -1,8 +1,6 @@
-import requests
 from flask import Blueprint, jsonify, request
 
 from app.services import tmdb_service
-from app.services.config import TMDB_BASE_URL, TMDB_KEY
 from app.services.tmdb_service import get_top_rated_shows, get_trending_shows, get_tv_watchlist, \
     get_popular_running_shows, search_tv_shows_by_name, advanced_search
 
@@ -36,24 +34,15 @@ def home_tv():
 
 @tv_shows_bp.route("/api/tv/<int:show_id>", methods=["GET"])
 def show_detail(show_id):
-    # Fetch show details
-    show_data = tmdb_service.get_tv_show_details(show_id)
-    params = {'api_key': TMDB_KEY}
+    # Fetch show details together with every season's episodes
+    show_data = tmdb_service.get_tv_show_with_seasons(show_id)
 
-    # Fetch seasons and episodes
     seasons = show_data.get('seasons', [])
     seasons = [season for season in seasons if season.get('season_number') != 0]  # Filter out season 0
 
     vote_average = show_data.get('vote_average', 0)
     user_score_percentage = round(vote_average * 10)
 
-    for season in seasons:
-        season_number = season.get('season_number')
-        episodes_url = f"{TMDB_BASE_URL}/tv/{show_id}/season/{season_number}"
-        episodes_response = requests.get(episodes_url, params=params)
-        episodes_data = episodes_response.json()
-        season['episodes'] = [episode['episode_number'] for episode in episodes_data.get('episodes', [])]
-
     show = {
         'name': show_data.get('name'),
         'release_date': show_data.get('first_air_date'),
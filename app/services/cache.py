@@ -0,0 +1,121 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+# Background refreshes of stale entries run here so the request that found them never waits
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+
+_caches = []
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with per-entry TTL, LRU eviction and stale-while-revalidate.
+    - `max_entries`: Upper bound on stored entries, the least recently used one is evicted first.
+    - `max_stale`: How long (seconds) past its TTL an entry may still be served while it is refreshed.
+    """
+
+    def __init__(self, name, max_entries=512, max_stale=24 * 60 * 60):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches.append(self)
+
+    def get(self, key):
+        """Returns the cached value if it is still fresh, otherwise None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """Like `get`, but without counting a hit or miss or refreshing the entry's LRU position."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < monotonic():
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drops a single key, or the whole cache when no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_or_fetch(self, key, fetch, ttl):
+        """
+        Returns the cached value for `key`, calling `fetch()` on a miss.
+        Stale entries are returned immediately and refreshed in the background.
+        A `fetch()` returning None is not cached.
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if now - expires_at <= self.max_stale:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        _refresh_executor.submit(self._refresh, key, fetch, ttl)
+                    return value
+            self.misses += 1
+
+        value = fetch()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def _refresh(self, key, fetch, ttl):
+        try:
+            value = fetch()
+            if value is not None:
+                self.set(key, value, ttl)
+        except Exception as e:
+            logging.warning(f"Background refresh of {self.name} cache entry failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def cache_stats():
+    return {cache.name: cache.stats() for cache in _caches}
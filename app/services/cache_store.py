@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from time import time
+
+from app.services.config import CACHE_DB_PATH, CACHE_MAX_BYTES, CACHE_MEMORY_ENTRIES, CACHE_NAMESPACE_TTLS, \
+    CACHE_DEFAULT_TTL, TMP_DIR
+
+# Bumped in the database's user_version once the per-key JSON files of the old file cache are cleaned up
+SCHEMA_VERSION = 1
+
+
+class CacheStore:
+    """
+    Persistent key/value cache: SQLite (WAL) on disk with an in-process LRU in front of it.
+    - Values are stored as zlib-compressed compact JSON.
+    - Upserts are atomic, readers never see a half written entry.
+    - Once the stored payloads exceed `max_bytes`, expired entries and then the least recently used ones are evicted.
+    """
+
+    def __init__(self, db_path, max_bytes, memory_entries=512):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._local = threading.local()
+        self._memory = OrderedDict()  # (namespace, key) -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._total_bytes = None  # Sum of the stored payload sizes, counted once then kept up to date
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                connection.execute('''CREATE TABLE IF NOT EXISTS cache
+                                      (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,
+                                       size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL,
+                                       PRIMARY KEY (namespace, key))''')
+                connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)')
+                if connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                    remove_legacy_json_files(TMP_DIR)
+                    connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+                with self._lock:
+                    self._total_bytes = total
+                self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace, key):
+        """Returns the stored value, or None if it is missing or expired."""
+        now = time()
+        with self._lock:
+            entry = self._memory.get((namespace, key))
+            if entry is not None and entry[1] >= now:
+                self._memory.move_to_end((namespace, key))
+                self.memory_hits += 1
+                return entry[0]
+
+        try:
+            connection = self._connection()
+            row = connection.execute('SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?',
+                                     (namespace, key)).fetchone()
+            if row is None or row[1] < now:
+                with self._lock:
+                    self.misses += 1
+                return None
+            connection.execute('UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                               (now, namespace, key))
+            value = json.loads(zlib.decompress(row[0]))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logging.error(f"Cache read failed for {namespace}/{key}: {e}")
+            return None
+
+        self._remember(namespace, key, value, row[1])
+        with self._lock:
+            self.disk_hits += 1
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        if ttl is None:
+            ttl = CACHE_NAMESPACE_TTLS.get(namespace, CACHE_DEFAULT_TTL)
+        now = time()
+        blob = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+        try:
+            connection = self._connection()
+            replaced = self._stored_size(connection, namespace, key)
+            connection.execute('INSERT OR REPLACE INTO cache (namespace, key, value, size, expires_at, accessed_at) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (namespace, key, blob, len(blob), now + ttl, now))
+            with self._lock:
+                self._total_bytes += len(blob) - replaced
+            self._evict(connection, now)
+        except sqlite3.Error as e:
+            logging.error(f"Cache write failed for {namespace}/{key}: {e}")
+        self._remember(namespace, key, value, now + ttl)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._memory.pop((namespace, key), None)
+        try:
+            connection = self._connection()
+            removed = self._stored_size(connection, namespace, key)
+            connection.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (namespace, key))
+            with self._lock:
+                self._total_bytes -= removed
+        except sqlite3.Error as e:
+            logging.error(f"Cache delete failed for {namespace}/{key}: {e}")
+
+    def _remember(self, namespace, key, value, expires_at):
+        with self._lock:
+            self._memory[(namespace, key)] = (value, expires_at)
+            self._memory.move_to_end((namespace, key))
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    @staticmethod
+    def _stored_size(connection, namespace, key):
+        row = connection.execute('SELECT size FROM cache WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        return row[0] if row else 0
+
+    def _evict(self, connection, now):
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+        evicted = connection.execute('DELETE FROM cache WHERE expires_at < ?', (now,)).rowcount
+        # Only counted again over the cap, which also picks up what other workers wrote to the same file
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        # Drop the least recently used entries until the store is back under 90% of its cap
+        for rowid, size in connection.execute('SELECT rowid, size FROM cache ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes * 0.9:
+                break
+            connection.execute('DELETE FROM cache WHERE rowid = ?', (rowid,))
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total_bytes = total
+            self.evictions += evicted
+
+    def stats(self):
+        try:
+            entries, size = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': size,
+                'max_bytes': self.max_bytes,
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def remove_legacy_json_files(directory):
+    """Deletes the `wizdom.*.json` files the old per-key file cache left in `directory`."""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    removed = 0
+    for entry in entries:
+        if entry.name.startswith('wizdom.') and entry.name.endswith('.json') and entry.is_file():
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError as e:
+                logging.warning(f"Failed to remove legacy cache file {entry.path}: {e}")
+    if removed:
+        logging.info(f"Removed {removed} legacy JSON cache files from {directory}")
+
+
+cache_store = CacheStore(CACHE_DB_PATH, CACHE_MAX_BYTES, CACHE_MEMORY_ENTRIES)
@@ -4,6 +4,13 @@ global_progress = "0"
 global_sync_process = None
 
 ffmpeg_path = os.getenv('FFMPEG_PATH', 'ffmpeg')  # Default to 'ffmpeg' if not set
+ffprobe_path = os.getenv('FFPROBE_PATH', 'ffprobe')
+# Concurrent ffmpeg processes (remuxes, HLS producers), requests over the cap wait for a slot up to the queue timeout
+FFMPEG_MAX_SESSIONS = int(os.getenv('FFMPEG_MAX_SESSIONS', 4))
+FFMPEG_QUEUE_TIMEOUT = float(os.getenv('FFMPEG_QUEUE_TIMEOUT', 10))
+# ISO 639-2 audio languages preferred when picking the track to stream, in order
+PREFERRED_AUDIO_LANGUAGES = [language.strip().lower()
+                             for language in os.getenv('PREFERRED_AUDIO_LANGUAGES', 'eng').split(',') if language.strip()]
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
@@ -31,14 +38,72 @@ NETWORK_ID_MAP = {'Netflix': 213, 'HBO': 3186, 'Disney Plus': 2739, 'Apple TV':
 
 TMDB_BASE_URL = os.getenv('TMDB_BASE_URL')
 TMDB_KEY = os.getenv('TMDB_KEY')
+TMDB_SESSION_ID = os.getenv('TMDB_SESSION_ID')
+TMDB_POOL_SIZE = int(os.getenv('TMDB_POOL_SIZE', 20))
+TMDB_RETRIES = int(os.getenv('TMDB_RETRIES', 3))
+TMDB_RETRY_BACKOFF = float(os.getenv('TMDB_RETRY_BACKOFF', 0.5))
+TMDB_CACHE_MAX_ENTRIES = int(os.getenv('TMDB_CACHE_MAX_ENTRIES', 1000))
+# Seconds a cached TMDB listing page stays fresh, per list type
+TMDB_LIST_TTLS = {
+    'trending': int(os.getenv('TMDB_TTL_TRENDING', 15 * 60)),
+    'popular': int(os.getenv('TMDB_TTL_POPULAR', 30 * 60)),
+    'top_rated': int(os.getenv('TMDB_TTL_TOP_RATED', 6 * 60 * 60)),
+    'discover': int(os.getenv('TMDB_TTL_DISCOVER', 30 * 60)),
+    'watchlist': int(os.getenv('TMDB_TTL_WATCHLIST', 60))
+}
+TMDB_SHOW_TTL = int(os.getenv('TMDB_TTL_SHOW', 6 * 60 * 60))
+# Seconds a movie detail page waits for all of its upstreams before answering with what it has
+MOVIE_DETAIL_DEADLINE = float(os.getenv('MOVIE_DETAIL_DEADLINE', 8))
+TMDB_TIMEOUT = (float(os.getenv('TMDB_CONNECT_TIMEOUT', 3.05)), float(os.getenv('TMDB_READ_TIMEOUT', 10)))
 QBITTORRENT_BASE_URL = os.getenv('QBITTORRENT_BASE_URL')
 QBITTORRENT_USERNAME = os.getenv('QBITTORRENT_USERNAME')
 QBITTORRENT_PASSWORD = os.getenv('QBITTORRENT_PASSWORD')
+QBITTORRENT_SYNC_INTERVAL = float(os.getenv('QBITTORRENT_SYNC_INTERVAL', 2))
+QBITTORRENT_TIMEOUT = (float(os.getenv('QBITTORRENT_CONNECT_TIMEOUT', 3.05)),
+                       float(os.getenv('QBITTORRENT_TIMEOUT', 15)))
 JELLYFIN_BASE_URL = os.getenv('JELLYFIN_BASE_URL')
 JELLYFIN_API_KEY = os.getenv('JELLYFIN_API_KEY')
-RARBG_BASE_URL = "https://rargb.to/"
+# A library scan starts once requests stopped arriving for the quiet period, at the latest after the max delay
+JELLYFIN_SCAN_QUIET_PERIOD = float(os.getenv('JELLYFIN_SCAN_QUIET_PERIOD', 10))
+JELLYFIN_SCAN_MAX_DELAY = float(os.getenv('JELLYFIN_SCAN_MAX_DELAY', 60))
+RARBG_BASE_URL = os.getenv('TORRENT_BASE_URL', "https://rargb.to/")
+APIBAY_BASE_URL = os.getenv('APIBAY_BASE_URL', "https://apibay.org/")
+# Comma separated indexers searched in parallel, see app/services/indexers
+TORRENT_INDEXERS = [name.strip() for name in os.getenv('TORRENT_INDEXERS', 'rargb').split(',') if name.strip()]
+TORRENT_SEARCH_DEADLINE = float(os.getenv('TORRENT_SEARCH_DEADLINE', 10))
+TORRENT_CACHE_TTL = int(os.getenv('TORRENT_CACHE_TTL', 10 * 60))
+TORRENT_CACHE_MAX_ENTRIES = int(os.getenv('TORRENT_CACHE_MAX_ENTRIES', 200))
+MAGNET_PREFETCH_COUNT = int(os.getenv('MAGNET_PREFETCH_COUNT', 5))
+MAGNET_PREFETCH_WORKERS = int(os.getenv('MAGNET_PREFETCH_WORKERS', 2))
+MAGNET_BATCH_WORKERS = int(os.getenv('MAGNET_BATCH_WORKERS', 8))
+TORRENT_BATCH_MAX_ITEMS = int(os.getenv('TORRENT_BATCH_MAX_ITEMS', 50))
+TORRENT_SEARCH_PAGES = int(os.getenv('TORRENT_SEARCH_PAGES', 3))
+TORRENT_PAGE_TIMEOUT = (float(os.getenv('TORRENT_CONNECT_TIMEOUT', 3.05)), float(os.getenv('TORRENT_PAGE_TIMEOUT', 8)))
 DOWNLOADS_BASE_PATH = os.getenv('DOWNLOADS_BASE_PATH')
-DASH_DIRECTORY = os.getenv('DASH_DIRECTORY')
 TMP_DIR = '../../../tmp'
+# HLS segments produced on demand, one sub directory per media file
+DASH_DIRECTORY = os.getenv('DASH_DIRECTORY', os.path.join(TMP_DIR, 'dash'))
+HLS_SEGMENT_SECONDS = float(os.getenv('HLS_SEGMENT_SECONDS', 6))
+HLS_CACHE_MAX_BYTES = int(os.getenv('HLS_CACHE_MAX_BYTES', 10 * 1024 ** 3))
 SUBS_DIR = '../../../subs'
+# Fragmented MP4 remuxes of MKV files, reused until the source file changes
+REMUX_CACHE_DIR = os.getenv('REMUX_CACHE_DIR', os.path.join(TMP_DIR, 'remux'))
+REMUX_CACHE_MAX_BYTES = int(os.getenv('REMUX_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+# Seconds a range request past the written part of a running remux waits for ffmpeg to get there
+REMUX_RANGE_WAIT = float(os.getenv('REMUX_RANGE_WAIT', 30))
+# Streaming a file that is still downloading: seconds a reader waits for a missing piece, and the piece poll interval
+TORRENT_STREAM_WAIT = float(os.getenv('TORRENT_STREAM_WAIT', 60))
+TORRENT_STREAM_POLL_INTERVAL = float(os.getenv('TORRENT_STREAM_POLL_INTERVAL', 1))
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(TMP_DIR, 'cache.sqlite3'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_MEMORY_ENTRIES = int(os.getenv('CACHE_MEMORY_ENTRIES', 512))
+CACHE_DEFAULT_TTL = 30 * 60
+# Seconds a persisted response stays fresh, per cache namespace
+CACHE_NAMESPACE_TTLS = {
+    'wizdom.imdb': int(os.getenv('CACHE_TTL_WIZDOM', 30 * 60)),
+    'wizdom.search': int(os.getenv('CACHE_TTL_TMDB_SEARCH', 24 * 60 * 60)),
+    'magnet': int(os.getenv('CACHE_TTL_MAGNET', 30 * 24 * 60 * 60)),
+    'hls': 30 * 24 * 60 * 60,  # Keyed by path, size and mtime, a changed file gets a new entry
+    'probe': 30 * 24 * 60 * 60
+}
 WIZDOM_DOMAIN = 'wizdom.xyz/api'
@@ -0,0 +1,267 @@
+import itertools
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+from time import monotonic
+
+from app.services.config import FFMPEG_MAX_SESSIONS, FFMPEG_QUEUE_TIMEOUT
+from app.services.utils import is_windows
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class FfmpegBusyError(RuntimeError):
+    """Raised when no ffmpeg slot frees up within the queue timeout."""
+
+
+class FfmpegSlot:
+    """A reserved place under the session cap, released once (by the session's reaper or by `release`)."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._released = False
+
+    def release(self):
+        with self.manager._condition:
+            if not self._released:
+                self._released = True
+                self.manager._reserved -= 1
+                self.manager._condition.notify()
+
+
+class FfmpegSession:
+    """
+    A running ffmpeg with its stderr drained into a bounded ring buffer.
+    A single reaper thread drains stderr until ffmpeg closes it, then waits for the process,
+    so no child is left as a zombie and ffmpeg never blocks on a full stderr pipe.
+    """
+
+    def __init__(self, manager, session_id, kind, process, slot, stderr_lines):
+        self.manager = manager
+        self.id = session_id
+        self.kind = kind
+        self.process = process
+        self.slot = slot
+        self.stderr = deque(maxlen=stderr_lines)
+        self.started = monotonic()
+        self.ended = None
+        self.returncode = None
+        self.cpu_seconds = None
+        self.killed = False
+        self.done = threading.Event()
+        threading.Thread(target=self._reap, name=f'ffmpeg-{session_id}', daemon=True).start()
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    def _reap(self):
+        try:
+            for line in iter(self.process.stderr.readline, b''):
+                self.stderr.append(line.decode(errors='replace').rstrip())
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.process.stderr.close()
+
+        if is_windows:
+            self.returncode = self.process.wait()
+        else:
+            try:
+                _, status, usage = os.wait4(self.process.pid, 0)
+                self.returncode = self.process.returncode = os.waitstatus_to_exitcode(status)
+                self.cpu_seconds = usage.ru_utime + usage.ru_stime
+            except ChildProcessError:
+                # Already reaped by Popen itself (e.g. polled before sending a signal)
+                self.returncode = self.process.wait()
+        self.ended = monotonic()
+        self.slot.release()
+        self.manager._finished(self)
+        self.done.set()
+
+    def running(self):
+        return not self.done.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for ffmpeg to exit, returns its exit code (None on timeout)."""
+        self.done.wait(timeout)
+        return self.returncode
+
+    def stop(self, grace=2):
+        """Terminates ffmpeg, killing it if it hasn't exited after `grace` seconds."""
+        if not self.running():
+            return
+        self.killed = True
+        try:
+            self.process.terminate()
+            if not self.done.wait(grace):
+                self.process.kill()
+        except OSError:
+            pass  # Exited in the meantime
+        self.done.wait(grace)
+
+    def stderr_tail(self, lines=20):
+        return '\n'.join(list(self.stderr)[-lines:])
+
+    def current_cpu_seconds(self):
+        if self.cpu_seconds is not None or is_windows:
+            return self.cpu_seconds
+        try:
+            with open(f'/proc/{self.process.pid}/stat') as f:
+                # Fields after the parenthesised command name, utime and stime are the 12th and 13th
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def stats(self):
+        cpu_seconds = self.current_cpu_seconds()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'pid': self.process.pid,
+            'seconds': round((self.ended or monotonic()) - self.started, 1),
+            'cpu_seconds': round(cpu_seconds, 2) if cpu_seconds is not None else None,
+            'returncode': self.returncode,
+            'killed': self.killed
+        }
+
+
+class FfmpegManager:
+    """
+    Starts every ffmpeg of the app under a cap of `max_sessions` concurrent processes.
+    Requests over the cap wait up to `queue_timeout` seconds for a slot, then get `FfmpegBusyError`.
+    """
+
+    def __init__(self, max_sessions=FFMPEG_MAX_SESSIONS, queue_timeout=FFMPEG_QUEUE_TIMEOUT, stderr_lines=200):
+        self.max_sessions = max_sessions
+        self.queue_timeout = queue_timeout
+        self.stderr_lines = stderr_lines
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._waiting = 0
+        self._sessions = {}  # id -> running FfmpegSession
+        self._recent = deque(maxlen=20)
+        self._ids = itertools.count(1)
+        self.started = 0
+        self.rejected = 0
+        self.failed = 0
+        self.killed = 0
+
+    def reserve(self, timeout=None):
+        """Reserves a slot, waiting up to `timeout` seconds (the queue timeout by default)."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = monotonic() + timeout
+        with self._condition:
+            self._waiting += 1
+            try:
+                while self._reserved >= self.max_sessions:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise FfmpegBusyError(f"{self._reserved} ffmpeg sessions running already")
+                    self._condition.wait(remaining)
+                self._reserved += 1
+            finally:
+                self._waiting -= 1
+        return FfmpegSlot(self)
+
+    def start(self, command, kind, stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL, slot=None, timeout=None):
+        """
+        Starts `command` in its own session, using `slot` or reserving one (see `reserve`).
+        Raises `FfmpegBusyError` over the cap and `OSError` when ffmpeg can't be started.
+        """
+        slot = slot or self.reserve(timeout)
+        try:
+            process = subprocess.Popen(command, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+        except OSError:
+            slot.release()
+            raise
+        with self._condition:
+            session = FfmpegSession(self, next(self._ids), kind, process, slot, self.stderr_lines)
+            self._sessions[session.id] = session
+            self.started += 1
+        return session
+
+    def _finished(self, session):
+        with self._condition:
+            self._sessions.pop(session.id, None)
+            self._recent.append(session)
+            if session.killed:
+                self.killed += 1
+            elif session.returncode != 0:
+                self.failed += 1
+                logging.error(f"ffmpeg {session.kind} session {session.id} exited with {session.returncode}: "
+                              f"{session.stderr_tail(5)}")
+
+    def stats(self):
+        with self._condition:
+            sessions = list(self._sessions.values())
+            recent = list(self._recent)
+            counters = {
+                'max_sessions': self.max_sessions,
+                'active': len(sessions),
+                'queued': self._waiting,
+                'started': self.started,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'killed': self.killed
+            }
+        return {
+            **counters,
+            'sessions': [session.stats() for session in sessions],
+            'recent': [session.stats() for session in recent]
+        }
+
+
+def feed_stdin(session, chunks, size=None):
+    """
+    Writes `chunks` to ffmpeg's stdin from a background thread, until they run out or ffmpeg goes away.
+    When `chunks` end before `size` bytes, ffmpeg is stopped instead of seeing a normal end of file,
+    so the output is cut off rather than finished as if the input were complete.
+    """
+
+    def feed():
+        written = 0
+        try:
+            for chunk in chunks:
+                if not session.running():
+                    break
+                session.process.stdin.write(chunk)
+                written += len(chunk)
+        except (OSError, ValueError):
+            pass  # ffmpeg exited or was stopped
+        finally:
+            chunks.close()
+            if size is not None and written < size and session.running():
+                logging.warning(f"ffmpeg {session.kind} session {session.id} aborted, "
+                                f"its input ended after {written} of {size} bytes")
+                session.stop()
+            try:
+                session.process.stdin.close()
+            except OSError:
+                pass
+
+    threading.Thread(target=feed, name=f'ffmpeg-{session.id}-stdin', daemon=True).start()
+
+
+def iter_stdout(session, chunk_size=64 * 1024, exit_grace=5):
+    """
+    Yields ffmpeg's output, stopping ffmpeg once the consumer (e.g. a disconnected client) closes the generator.
+    After a normal end of output ffmpeg gets `exit_grace` seconds to exit on its own, so it isn't counted as killed.
+    """
+    try:
+        while True:
+            chunk = session.stdout.read1(chunk_size)
+            if not chunk:
+                session.wait(exit_grace)
+                break
+            yield chunk
+    finally:
+        session.stop()
+        session.stdout.close()
+
+
+ffmpeg_manager = FfmpegManager()
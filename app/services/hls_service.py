@@ -0,0 +1,371 @@
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+from time import monotonic, sleep, time
+
+from app.services.cache_store import cache_store
+from app.services.config import DASH_DIRECTORY, HLS_SEGMENT_SECONDS, HLS_CACHE_MAX_BYTES, ffmpeg_path, ffprobe_path
+from app.services.ffmpeg_manager import ffmpeg_manager, FfmpegBusyError
+from app.services.probe_service import media_key, probe_media_file, select_audio_stream, video_stream, \
+    audio_arguments
+
+# A request this many segments past the producer's position waits for it instead of restarting ffmpeg there
+SEEK_AHEAD_SEGMENTS = 3
+# A producer this many segments ahead of the viewer, or idle for this long, is stopped
+MAX_AHEAD_SEGMENTS = 20
+PRODUCER_IDLE_SECONDS = 60
+
+
+SEGMENT_WAIT_SECONDS = 20
+# A playlist request waits this long for the keyframe scan before answering 503
+SCAN_WAIT_SECONDS = 5
+# Segment map kept next to the segments, it outlives the response cache entry
+MEDIA_FILE = 'media.json'
+KEY_PATTERN = re.compile(r'[0-9a-f]{40}$')
+
+_scans = {}  # media key -> Event set when the background scan finishes
+_scan_errors = {}  # media key -> exception of a failed scan, raised to the next caller
+_scans_lock = threading.Lock()
+
+
+def probe_media(path, wait=SCAN_WAIT_SECONDS):
+    """
+    The stream info (see `probe_media_file`) and video keyframe times of `path`.
+    Listing the keyframes reads the whole file once, so it runs in the background: returns None when the scan
+    isn't done after `wait` seconds. The result is cached for as long as the file is unchanged.
+    Raises `OSError`, `subprocess.CalledProcessError` or `ValueError` when ffprobe failed.
+    """
+    key = media_key(path)
+    media = load_media(key)
+    if media is not None:
+        return media
+
+    with _scans_lock:
+        error = _scan_errors.pop(key, None)
+        if error is not None:
+            raise error
+        done = _scans.get(key)
+        if done is None:
+            done = _scans[key] = threading.Event()
+            threading.Thread(target=_scan, args=(key, path, done), name=f'hls-scan-{key[:8]}', daemon=True).start()
+
+    if not done.wait(wait):
+        return None
+    with _scans_lock:
+        error = _scan_errors.pop(key, None)
+    if error is not None:
+        raise error
+    return load_media(key)
+
+
+def load_media(key):
+    """
+    The scanned media of `key` from the response cache, or from its segment map in DASH_DIRECTORY
+    when the cache evicted it. None when the media was never scanned (or its segments were evicted).
+    """
+    if not KEY_PATTERN.match(key):
+        return None
+    media = cache_store.get('hls', key)
+    if media is not None:
+        return media
+    try:
+        with open(os.path.join(DASH_DIRECTORY, key, MEDIA_FILE)) as f:
+            media = json.load(f)
+    except (OSError, ValueError):
+        return None
+    cache_store.set('hls', key, media)
+    return media
+
+
+def _scan(key, path, done):
+    try:
+        scan_media(key, path)
+    except Exception as e:
+        # Any failure is handed to the next caller, otherwise the playlist would answer 'being indexed' forever
+        logging.error(f"Keyframe scan of {path} failed: {e}")
+        with _scans_lock:
+            _scan_errors[key] = e
+    finally:
+        with _scans_lock:
+            _scans.pop(key, None)
+        done.set()
+
+
+def scan_media(key, path):
+    """Probes `path` and lists its keyframes, caching the result under `key`."""
+    probe = probe_media_file(path)
+    packets = subprocess.run(
+        [ffprobe_path, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+         '-of', 'csv=p=0', path], capture_output=True, check=True, text=True).stdout
+
+    keyframes = []
+    for line in packets.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    keyframes.sort()
+
+    start_time = probe['format']['start_time']
+    video, audio = video_stream(probe), select_audio_stream(probe)
+    media = {
+        'key': key,
+        'path': path,
+        'end': start_time + probe['format']['duration'],
+        'video_index': video['index'] if video else None,
+        'audio': audio,
+        'segments': segment_starts(keyframes or [start_time], HLS_SEGMENT_SECONDS)
+    }
+    directory = os.path.join(DASH_DIRECTORY, key)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, MEDIA_FILE), 'w') as f:
+        json.dump(media, f)
+    cache_store.set('hls', key, media)
+    return media
+
+
+def segment_starts(keyframes, target_duration):
+    """Groups keyframes into segments of at least `target_duration` seconds, each starting on a keyframe."""
+    starts = [keyframes[0]]
+    for keyframe in keyframes[1:]:
+        if keyframe - starts[-1] >= target_duration:
+            starts.append(keyframe)
+    return starts
+
+
+def build_playlist(media, segment_url):
+    """VOD playlist of `media`'s segments, `segment_url(index)` gives each segment's URI."""
+    starts = media['segments']
+    durations = [end - start for start, end in zip(starts, starts[1:] + [media['end']])]
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-PLAYLIST-TYPE:VOD',
+             f'#EXT-X-TARGETDURATION:{math.ceil(max(durations))}', '#EXT-X-MEDIA-SEQUENCE:0']
+    for index, duration in enumerate(durations):
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(segment_url(index))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+class SegmentProducer:
+    """One ffmpeg run writing the segments of a media file from `start` on into its own run directory."""
+
+    def __init__(self, media, start, directory):
+        self.media = media
+        self.start = start
+        self.run_directory = os.path.join(directory, f'run-{start}-{os.getpid()}')
+        self.segment_list = os.path.join(self.run_directory, 'segments.csv')
+        self.produced = start - 1  # Last segment moved into the media directory
+        self.last_requested = start
+        self.last_request_time = monotonic()
+        os.makedirs(self.run_directory, exist_ok=True)
+        try:
+            # Never waits for a slot, the caller holds the segmenter lock and retries instead
+            self.session = ffmpeg_manager.start(self.command(), 'hls', timeout=0)
+        except (FfmpegBusyError, OSError):
+            self.remove()
+            raise
+
+    def command(self):
+        starts = self.media['segments']
+        video_map = f"0:{self.media['video_index']}" if self.media['video_index'] is not None else '0:v:0'
+        audio = self.media['audio']
+        audio_map = ['-map', f"0:{audio['index']}"] if audio else []
+        command = [ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+                   # Input seeking lands on the segment's keyframe, -copyts keeps the source timestamps so segments
+                   # from different runs line up
+                   '-ss', f'{starts[self.start] + 0.0005:.6f}', '-i', self.media['path'], '-copyts',
+                   '-map', video_map, *audio_map, '-sn', '-c:v', 'copy', *audio_arguments(audio),
+                   '-f', 'segment', '-segment_format', 'mpegts', '-muxdelay', '0',
+                   '-segment_start_number', str(self.start),
+                   '-segment_list', self.segment_list, '-segment_list_type', 'csv', '-segment_list_flags', '+live']
+        if self.start + 1 < len(starts):
+            # Cut on the first keyframe at or after each boundary, i.e. exactly on the next segment's keyframe
+            command += ['-segment_times', ','.join(f'{start - 0.001:.6f}' for start in starts[self.start + 1:])]
+        return command + [os.path.join(self.run_directory, '%05d.ts')]
+
+    def collect(self, directory):
+        """Moves the segments ffmpeg finished writing (listed in its segment list) into `directory`."""
+        try:
+            with open(self.segment_list) as f:
+                names = [line.split(',', 1)[0] for line in f if line.strip()]
+        except FileNotFoundError:
+            return
+        for name in names:
+            index = int(os.path.splitext(name)[0])
+            if index <= self.produced:
+                continue
+            source = os.path.join(self.run_directory, name)
+            if os.path.exists(source):
+                os.replace(source, os.path.join(directory, name))
+            self.produced = index
+
+    def running(self):
+        return self.session.running()
+
+    def stop(self):
+        self.session.stop()
+
+    def remove(self):
+        shutil.rmtree(self.run_directory, ignore_errors=True)
+
+
+class HlsSegmenter:
+    """
+    Produces HLS segments on demand into `directory/<media key>/`.
+    A segment is cut by one ffmpeg per media file, started at the requested segment. A request close ahead of that
+    producer waits for it, a seek further away restarts it at the new position. Segments are keyframe aligned and
+    identical whatever run produced them, so finished segments are shared by every viewer and kept until the
+    directory exceeds `max_bytes`, least recently watched media first.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._producers = {}  # media key -> SegmentProducer
+        self._lock = threading.Lock()
+        self._monitor = None
+        self.served = 0
+        self.started = 0
+        self.restarts = 0
+        self.evictions = 0
+
+    def media_directory(self, key):
+        return os.path.join(self.directory, key)
+
+    def segment_path(self, key, index):
+        return os.path.join(self.media_directory(key), f'{index:05d}.ts')
+
+    def segment(self, media, index, timeout=SEGMENT_WAIT_SECONDS):
+        """Returns the path of segment `index` of `media` once it is written, None if it isn't ready in time."""
+        key = media['key']
+        path = self.segment_path(key, index)
+        deadline = monotonic() + timeout
+        started = False
+        while True:
+            retired = None
+            with self._lock:
+                producer = self._producers.get(key)
+                if producer is not None:
+                    producer.last_requested = max(index, producer.last_requested)
+                    producer.last_request_time = monotonic()
+                if os.path.exists(path):
+                    self.served += 1
+                    os.utime(self.media_directory(key))
+                    return path
+
+                if producer is None or not producer.running() or not (
+                        producer.start <= index <= producer.produced + SEEK_AHEAD_SEGMENTS):
+                    if started:
+                        # The ffmpeg started for this request exited without writing the segment
+                        return None
+                    if producer is not None:
+                        # Detached here, stopped below without holding the lock, restarted on the next round
+                        self.restarts += 1
+                        retired = self._producers.pop(key)
+                    else:
+                        os.makedirs(self.media_directory(key), exist_ok=True)
+                        try:
+                            self._producers[key] = SegmentProducer(media, index, self.media_directory(key))
+                            self.started += 1
+                            started = True
+                            self._ensure_monitor()
+                        except FfmpegBusyError:
+                            pass  # Every ffmpeg slot is taken, try again on the next round until the deadline
+
+            if retired is not None:
+                retired.stop()
+                retired.remove()
+                continue
+            if monotonic() >= deadline:
+                return None
+            sleep(0.1)
+
+    def _ensure_monitor(self):
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._run_monitor, name='hls-monitor', daemon=True)
+            self._monitor.start()
+
+    def _run_monitor(self):
+        while True:
+            finished = []
+            with self._lock:
+                for key, producer in list(self._producers.items()):
+                    try:
+                        producer.collect(self.media_directory(key))
+                    except OSError as e:
+                        logging.error(f"Failed to collect HLS segments of {key}: {e}")
+                    running = producer.running()
+                    idle = monotonic() - producer.last_request_time > PRODUCER_IDLE_SECONDS
+                    if not running or idle or producer.produced > producer.last_requested + MAX_AHEAD_SEGMENTS:
+                        # Stopped ahead of the viewer, the next missing segment restarts ffmpeg right there
+                        del self._producers[key]
+                        finished.append((key, producer))
+            # Stopping waits for ffmpeg to exit, segment requests must not wait behind it
+            for key, producer in finished:
+                producer.stop()
+                try:
+                    producer.collect(self.media_directory(key))
+                except OSError as e:
+                    logging.error(f"Failed to collect HLS segments of {key}: {e}")
+                producer.remove()
+            if finished:
+                self.evict()
+            sleep(0.25)
+
+    def evict(self):
+        """
+        Removes the segments of the least recently watched media until the directory fits in `max_bytes`.
+        The directories are measured and deleted without holding the lock, only the rename that takes one out
+        of use happens under it.
+        """
+        entries = []
+        try:
+            directories = [entry for entry in os.scandir(self.directory)
+                           if entry.is_dir() and not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return
+        for entry in directories:
+            size = 0
+            for dirpath, _, filenames in os.walk(entry.path):
+                for filename in filenames:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, filename))
+                    except OSError:
+                        pass
+            try:
+                entries.append((entry.stat().st_mtime, size, entry.name, entry.path))
+            except FileNotFoundError:
+                pass
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            evicted_path = os.path.join(self.directory, f'.evicted-{key}-{os.getpid()}')
+            with self._lock:
+                try:
+                    if key in self._producers or time() - os.stat(path).st_mtime < PRODUCER_IDLE_SECONDS:
+                        continue
+                    os.replace(path, evicted_path)
+                except OSError:
+                    continue
+                self.evictions += 1
+            shutil.rmtree(evicted_path, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'producers': len(self._producers),
+                'served': self.served,
+                'started': self.started,
+                'restarts': self.restarts,
+                'evictions': self.evictions
+            }
+
+
+hls_segmenter = HlsSegmenter(DASH_DIRECTORY, HLS_CACHE_MAX_BYTES)
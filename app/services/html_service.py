@@ -1,77 +1,215 @@
 import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 
-import requests
+from app.services.cache import TTLCache
+from app.services.cache_store import cache_store
+from app.services.config import TORRENT_SEARCH_DEADLINE, MAGNET_PREFETCH_COUNT, MAGNET_PREFETCH_WORKERS, \
+    TORRENT_CACHE_TTL, TORRENT_CACHE_MAX_ENTRIES, MAGNET_BATCH_WORKERS
+from app.services.indexers import enabled_indexers, indexer_for
+from app.services.release_parser import quality_rank, normalize_resolution, normalize_codec, normalize_source
+from app.services.singleflight import SingleFlight
+from app.services.utils import sanitize_string
 
-from app.services.config import HEADERS, RARBG_BASE_URL
-from bs4 import BeautifulSoup
+indexer_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='indexer')
+# Kept small on purpose, prefetching must not compete with interactive searches
+magnet_executor = ThreadPoolExecutor(max_workers=MAGNET_PREFETCH_WORKERS, thread_name_prefix='magnet-prefetch')
+# Interactive batch downloads get their own pool so they never queue behind prefetches
+magnet_batch_executor = ThreadPoolExecutor(max_workers=MAGNET_BATCH_WORKERS, thread_name_prefix='magnet-batch')
+magnet_flight = SingleFlight('magnet')
+torrent_search_cache = TTLCache('torrent_searches', max_entries=TORRENT_CACHE_MAX_ENTRIES, max_stale=0)
 
-from app.services.utils import sanitize_string
 
+def fetch_magnet_link(torrent_url):
+    if torrent_url.startswith('magnet:'):
+        return torrent_url
+    magnet_link = cache_store.get('magnet', torrent_url)
+    if magnet_link is None:
+        magnet_link = magnet_flight.do(torrent_url, lambda: resolve_magnet_link(torrent_url))
+    return magnet_link
 
-def fetch_html(url):
-    response = requests.get(url, headers=HEADERS)
-    if response.status_code == 200:
-        return response.text
-    else:
-        print(f"Failed to retrieve content: {response.status_code}")
-        return None
-
-
-def parse_html(html):
-    soup = BeautifulSoup(html, 'lxml')
-    torrents = []
-
-    for row in soup.select("table.lista2t > tr.lista2"):
-        columns = row.select("td")
-        if len(columns) > 6:
-            title_column = columns[1].select_one("a")
-            if title_column:
-                title = title_column.text
-                link = RARBG_BASE_URL + title_column['href']
-                category = columns[2].text.strip()
-                if category in ["Movies/Bollywood", "Movies/Dubs/Dual Audio", "XXX/Video"]:
-                    continue
-                size = columns[4].text
-                seeders = int(columns[5].text)
-                leechers = columns[6].text
-                date_uploaded = columns[3].text
-
-                torrents.append({
-                    "title": title,
-                    "link": link,
-                    "category": category,
-                    "size": size,
-                    "seeders": seeders,
-                    "leechers": leechers,
-                    "date_uploaded": date_uploaded,
-                    "imdb_link": None  # Initially, set IMDb link to None
-                })
-
-    return torrents
 
+def resolve_magnet_link(torrent_url):
+    magnet_link = indexer_for(torrent_url).fetch_magnet(torrent_url)
+    if magnet_link:
+        cache_store.set('magnet', torrent_url, magnet_link)
+    return magnet_link
 
-def fetch_magnet_link(torrent_url):
-    html_content = fetch_html(torrent_url)
-    if html_content:
-        soup = BeautifulSoup(html_content, 'lxml')
-        magnet_link = soup.select_one('a[href^="magnet:?"]').get('href')
-        return magnet_link
-    else:
-        return None
 
+def fetch_magnet_links(torrent_urls):
+    """
+    Resolves several torrent pages to magnets concurrently.
+    Returns a dict of url -> magnet link, None for the pages that could not be resolved.
+    """
+    futures = {url: magnet_batch_executor.submit(fetch_magnet_link, url) for url in dict.fromkeys(torrent_urls)}
+    magnet_links = {}
+    for url, future in futures.items():
+        try:
+            magnet_links[url] = future.result()
+        except Exception as e:
+            logging.error(f"Failed to fetch magnet link of {url}: {e}")
+            magnet_links[url] = None
+    return magnet_links
 
-def search_torrents(query):
-    logging.info(f"Searching torrents with query: {query}")
-    all_torrents = []
+
+def prefetch_magnet_links(torrents, count=MAGNET_PREFETCH_COUNT):
+    """Resolves the magnets of the best seeded results in the background, so a download click skips the scrape."""
+    for torrent in torrents[:count]:
+        link = torrent['link']
+        if not link.startswith('magnet:') and cache_store.get('magnet', link) is None:
+            magnet_executor.submit(fetch_magnet_link, link)
+
+
+def run_indexer(indexer, query, batches):
+    started = monotonic()
+    try:
+        for torrents in indexer.search(query):
+            batches.put((indexer.name, torrents))
+        indexer.record(monotonic() - started)
+    except Exception as e:
+        logging.error(f"Indexer {indexer.name} failed searching '{query}': {e}")
+        indexer.record(monotonic() - started, error=True)
+    finally:
+        batches.put((indexer.name, None))
+
+
+def iter_search(query, deadline=TORRENT_SEARCH_DEADLINE):
+    """
+    Fans the query out to every enabled indexer in parallel and yields `(indexer_name, torrents)`
+    batches as soon as each indexer produces them.
+    Indexers still running after `deadline` seconds are abandoned, so one slow site never blocks the search.
+    """
     query = sanitize_string(query)
-    for page in range(1, 2):  # Fetch results from the first 3 pages
-        search_url = f"{RARBG_BASE_URL}search/{page}/?search={query}"
-        html_content = fetch_html(search_url)
-        if html_content:
-            all_torrents.extend(parse_html(html_content))
+    indexers = enabled_indexers()
+    batches = queue.Queue()
+    for indexer in indexers:
+        indexer_executor.submit(run_indexer, indexer, query, batches)
+
+    pending = {indexer.name: indexer for indexer in indexers}
+    expires_at = monotonic() + deadline
+    while pending:
+        try:
+            name, torrents = batches.get(timeout=max(0.0, expires_at - monotonic()))
+        except queue.Empty:
+            for indexer in pending.values():
+                logging.warning(f"Indexer {indexer.name} missed the search deadline for '{query}'")
+                indexer.record(deadline, timeout=True)
+            return
+        if torrents is None:
+            pending.pop(name, None)
         else:
-            break
+            yield name, torrents
+
 
+def merge_torrents(torrents_by_key, torrents):
+    """
+    Adds rows into `torrents_by_key`, keeping one row per torrent with its highest seeder count.
+    Rows are identified by info hash when the indexer knows it, otherwise by their link.
+    """
+    for torrent in torrents:
+        key = torrent.get('info_hash') or torrent['link']
+        known = torrents_by_key.get(key)
+        if known is None or torrent['seeders'] > known['seeders']:
+            torrents_by_key[key] = torrent
+    return torrents_by_key
+
+
+def rank_torrents(torrents_by_key):
     # Sort torrents by the number of seeders in descending order
-    all_torrents.sort(key=lambda torrent: torrent['seeders'], reverse=True)
-    return all_torrents
+    return sorted(torrents_by_key.values(), key=lambda torrent: torrent['seeders'], reverse=True)
+
+
+SORT_KEYS = {
+    'seeders': lambda torrent: torrent['seeders'],
+    'size': lambda torrent: torrent['size_bytes'],
+    'quality': lambda torrent: (quality_rank(torrent['release']), torrent['seeders']),
+    'date': lambda torrent: torrent['date_uploaded'] or ''
+}
+
+
+def select_torrents(torrents, resolutions=None, codecs=None, sources=None, hdr=None, min_seeders=0, max_size=None,
+                    season=None, episode=None, sort='seeders', descending=True):
+    """
+    Filters and orders ranked search results on their parsed release metadata.
+    - `resolutions`, `codecs`, `sources`: Collections of accepted values (e.g. {'1080p', '4k'}), None accepts all.
+      They are normalized like parsed names, so '4k' matches 2160p releases and 'x265' matches HEVC ones.
+    - `hdr`: True keeps HDR/DV releases only, False keeps SDR only.
+    - `max_size`: Upper bound in bytes.
+    - `sort`: One of `SORT_KEYS`.
+    """
+    resolutions = {normalize_resolution(resolution) for resolution in resolutions} if resolutions else None
+    codecs = {normalize_codec(codec) for codec in codecs} if codecs else None
+    sources = {normalize_source(source) for source in sources} if sources else None
+
+    def accepted(torrent):
+        release = torrent['release']
+        return (torrent['seeders'] >= min_seeders
+                and (not resolutions or release['resolution'] in resolutions)
+                and (not codecs or release['codec'] in codecs)
+                and (not sources or release['source'] in sources)
+                and (hdr is None or bool(release['hdr']) == hdr)
+                and (max_size is None or torrent['size_bytes'] <= max_size)
+                and (season is None or release['season'] == season)
+                and (episode is None or release['episode'] == episode))
+
+    selected = [torrent for torrent in torrents if accepted(torrent)]
+    # Results are already ranked by seeders, only other orders need a sort
+    if sort != 'seeders' or not descending:
+        selected.sort(key=SORT_KEYS.get(sort, SORT_KEYS['seeders']), reverse=descending)
+    return selected
+
+
+def copy_results(torrents):
+    """
+    Copies result rows (and their parsed release) before they leave the search cache,
+    so a caller filtering, sorting or annotating them can't change what the next request sees.
+    """
+    return [{**torrent, 'release': dict(torrent['release'])} for torrent in torrents]
+
+
+def search_cache_key(query):
+    return ' '.join(sanitize_string(query).lower().split())
+
+
+def search_torrents(query, refresh=False):
+    """
+    Returns the merged and ranked results for `query`, reusing results searched in the last
+    `TORRENT_CACHE_TTL` seconds unless `refresh` is set. Callers get their own copy of the rows.
+    """
+    key = search_cache_key(query)
+    if refresh:
+        torrent_search_cache.invalidate(key)
+    return copy_results(torrent_search_cache.get_or_fetch(key, lambda: fetch_torrents(query), ttl=TORRENT_CACHE_TTL)
+                        or [])
+
+
+def iter_search_events(query, refresh=False):
+    """
+    Progressive variant of `search_torrents`: yields a `results` event with the rows of every batch
+    as soon as an indexer page is parsed, then a final `done` event carrying the merged ranking.
+    """
+    key = search_cache_key(query)
+    ranked_torrents = None if refresh else torrent_search_cache.get(key)
+    if ranked_torrents is None:
+        logging.info(f"Streaming torrents search with query: {query}")
+        torrents_by_key = {}
+        for indexer_name, torrents in iter_search(query):
+            merge_torrents(torrents_by_key, torrents)
+            yield {'type': 'results', 'indexer': indexer_name, 'torrents': copy_results(torrents)}
+        ranked_torrents = rank_torrents(torrents_by_key)
+        prefetch_magnet_links(ranked_torrents)
+        if ranked_torrents:
+            torrent_search_cache.set(key, ranked_torrents, TORRENT_CACHE_TTL)
+    yield {'type': 'done', 'torrents': copy_results(ranked_torrents)}
+
+
+def fetch_torrents(query):
+    logging.info(f"Searching torrents with query: {query}")
+    torrents_by_key = {}
+    for _, torrents in iter_search(query):
+        merge_torrents(torrents_by_key, torrents)
+    ranked_torrents = rank_torrents(torrents_by_key)
+    prefetch_magnet_links(ranked_torrents)
+    # Empty results are usually a failed or timed out scrape, they are not cached
+    return ranked_torrents or None
@@ -0,0 +1,34 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(pool_size=10, retries=3, backoff=0.5, headers=None):
+    """
+    Builds a keep-alive `requests.Session` backed by a connection pool.
+    - `pool_size`: Maximum number of connections kept open per host.
+    - `retries`: How many times idempotent calls are retried on connection errors, 429 and 5xx.
+    - `backoff`: Exponential backoff factor between retries (honours `Retry-After` on 429/503).
+    Failed retries return the last response instead of raising, so callers can keep checking `status_code`.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
@@ -0,0 +1,19 @@
+from app.services.config import TORRENT_INDEXERS
+from .apibay import ApibayIndexer
+from .base import Indexer
+from .rargb import RargbIndexer
+
+# Every available indexer, only those listed in TORRENT_INDEXERS are searched
+indexers = {indexer.name: indexer for indexer in (RargbIndexer(), ApibayIndexer())}
+
+
+def enabled_indexers():
+    return [indexers[name] for name in TORRENT_INDEXERS if name in indexers]
+
+
+def indexer_for(url):
+    return next((indexer for indexer in indexers.values() if indexer.owns(url)), indexers['rargb'])
+
+
+def indexer_stats():
+    return {name: indexer.stats() for name, indexer in indexers.items()}
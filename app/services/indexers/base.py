@@ -0,0 +1,114 @@
+import logging
+import re
+import threading
+from abc import ABC, abstractmethod
+
+import requests
+
+from app.services.config import HEADERS
+from app.services.http_client import create_session
+from app.services.release_parser import parse_release_name, parse_size
+from app.services.singleflight import SingleFlight
+
+html_flight = SingleFlight('html')
+indexer_session = create_session(pool_size=16, retries=1, headers=HEADERS)
+
+
+def fetch_html(url, timeout=None):
+    try:
+        response = html_flight.do(url, lambda: indexer_session.get(url, timeout=timeout))
+    except requests.RequestException as e:
+        logging.error(f"Failed to retrieve {url}: {e}")
+        return None
+    if response.status_code == 200:
+        return response.text
+    else:
+        logging.error(f"Failed to retrieve {url}: HTTP {response.status_code}")
+        return None
+
+
+def to_int(text):
+    """Parses counters such as seeders/leechers, returning 0 for anything malformed."""
+    digits = re.sub(r'[^\d]', '', str(text or ''))
+    return int(digits) if digits else 0
+
+
+def format_size(size_bytes):
+    size = float(size_bytes)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def torrent_row(indexer, title, link, category, size, seeders, leechers, date_uploaded, info_hash=None,
+                size_bytes=None):
+    """
+    Builds a search result in the schema shared by every indexer.
+    Size and release name are parsed once here so filtering and ranking never re-parse them.
+    """
+    return {
+        "title": title,
+        "link": link,
+        "category": category,
+        "size": size,
+        "size_bytes": size_bytes if size_bytes is not None else parse_size(size),
+        "release": dict(parse_release_name(title)),
+        "seeders": to_int(seeders),
+        "leechers": str(to_int(leechers)),  # A string, as rargb rows always had it
+        "date_uploaded": date_uploaded,
+        "imdb_link": None,  # Initially, set IMDb link to None
+        "indexer": indexer,
+        "info_hash": info_hash.lower() if info_hash else None
+    }
+
+
+class Indexer(ABC):
+    """
+    A torrent site the search engine can fan out to.
+    Subclasses implement `search` (yielding lists of rows built with `torrent_row` as they become available),
+    `owns` and `fetch_magnet`.
+    """
+    name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+
+    @abstractmethod
+    def search(self, query):
+        """Yields lists of result rows for `query` as they become available."""
+
+    @abstractmethod
+    def owns(self, url):
+        """Whether `url` is a result link produced by this indexer."""
+
+    @abstractmethod
+    def fetch_magnet(self, url):
+        """The magnet link of result `url`, None when it can't be retrieved."""
+
+    def record(self, latency, error=False, timeout=False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+                return
+            self.searches += 1
+            self.last_latency = latency
+            self.total_latency += latency
+            if error:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'searches': self.searches,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'last_latency': round(self.last_latency, 3) if self.last_latency is not None else None,
+                'average_latency': round(self.total_latency / self.searches, 3) if self.searches else None
+            }
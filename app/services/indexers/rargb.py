@@ -0,0 +1,89 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import unescape
+
+import lxml.html
+from lxml import etree
+
+from app.services.config import RARBG_BASE_URL, TORRENT_SEARCH_PAGES, TORRENT_PAGE_TIMEOUT
+from app.services.indexers.base import Indexer, fetch_html, torrent_row
+
+EXCLUDED_CATEGORIES = {"Movies/Bollywood", "Movies/Dubs/Dual Audio", "XXX/Video"}
+
+page_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='rargb')
+
+
+# Same rows as the CSS selector "table.lista2t > tr.lista2", evaluated directly on the lxml tree
+RESULT_ROWS = etree.XPath('//table[contains(concat(" ", normalize-space(@class), " "), " lista2t ")]'
+                          '/tr[contains(concat(" ", normalize-space(@class), " "), " lista2 ")]')
+MAGNET_HREF = re.compile(r'href\s*=\s*["\'](magnet:\?[^"\']+)["\']', re.IGNORECASE)
+
+
+def parse_html(html):
+    torrents = []
+
+    for row in RESULT_ROWS(lxml.html.fromstring(html)):
+        columns = row.findall('td')
+        if len(columns) > 6:
+            title_column = columns[1].find('.//a')
+            if title_column is not None and title_column.get('href') is not None:
+                category = columns[2].text_content().strip()
+                if category in EXCLUDED_CATEGORIES:
+                    continue
+                torrents.append(torrent_row('rargb', title_column.text_content(),
+                                            RARBG_BASE_URL + title_column.get('href'), category,
+                                            columns[4].text_content(), columns[5].text_content(),
+                                            columns[6].text_content(), columns[3].text_content()))
+
+    return torrents
+
+
+def find_magnet(html):
+    """Scans the raw page for the first magnet href instead of building a tree for a single attribute."""
+    match = MAGNET_HREF.search(html)
+    return unescape(match.group(1)) if match else None
+
+
+def fetch_search_page(query, page):
+    search_url = f"{RARBG_BASE_URL}search/{page}/?search={query}"
+    html_content = fetch_html(search_url, timeout=TORRENT_PAGE_TIMEOUT)
+    return parse_html(html_content) if html_content else []
+
+
+def iter_search_pages(query, pages=TORRENT_SEARCH_PAGES):
+    """
+    Fetches the first `pages` result pages concurrently and yields `(page, torrents)` in page order,
+    each one as soon as it and every page before it have arrived.
+    An empty page means there is nothing after it: later pages are cancelled, and never yielded even if they
+    finished first (past the end the site may serve repeated or unrelated rows).
+    """
+    futures = {page_executor.submit(fetch_search_page, query, page): page for page in range(1, pages + 1)}
+    arrived = {}
+    next_page = 1
+    try:
+        for future in as_completed(futures):
+            arrived[futures[future]] = future.result()
+            while next_page in arrived:
+                torrents = arrived.pop(next_page)
+                if not torrents:
+                    return
+                yield next_page, torrents
+                next_page += 1
+    finally:
+        for pending in futures:
+            pending.cancel()
+
+
+class RargbIndexer(Indexer):
+    name = 'rargb'
+
+    def search(self, query):
+        for _, torrents in iter_search_pages(query):
+            yield torrents
+
+    def owns(self, url):
+        return url.startswith(RARBG_BASE_URL)
+
+    def fetch_magnet(self, url):
+        html_content = fetch_html(url, timeout=TORRENT_PAGE_TIMEOUT)
+        return find_magnet(html_content) if html_content else None
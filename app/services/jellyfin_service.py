@@ -1,20 +1,115 @@
 import logging
+import threading
+from time import monotonic
 
-from app.services.config import JELLYFIN_BASE_URL, JELLYFIN_API_KEY
-from flask import jsonify
+from app.services.config import JELLYFIN_BASE_URL, JELLYFIN_API_KEY, JELLYFIN_SCAN_QUIET_PERIOD, \
+    JELLYFIN_SCAN_MAX_DELAY
 import requests
 
+SCAN_LIBRARY_TASK_ID = '7738148ffcd07979c7ceb148e06b3aed'
+JELLYFIN_TIMEOUT = (3.05, 10)
+
 
 def notify_jellyfin():
+    """Starts Jellyfin's 'Scan Media Library' task. Returns True when Jellyfin accepted the request."""
     if not JELLYFIN_BASE_URL or not JELLYFIN_API_KEY:
         print("Jellyfin credentials not set.")
-        return jsonify({'error': 'Jellyfin credentials not set.'}), 400
+        return False
 
-    scan_library_url = (f'{JELLYFIN_BASE_URL}/ScheduledTasks/Running/7738148ffcd07979c7ceb148e06b3aed'
-                        f'?api_key={JELLYFIN_API_KEY}')
+    scan_library_url = f'{JELLYFIN_BASE_URL}/ScheduledTasks/Running/{SCAN_LIBRARY_TASK_ID}?api_key={JELLYFIN_API_KEY}'
     try:
-        response = requests.post(url=scan_library_url)
+        response = requests.post(url=scan_library_url, timeout=JELLYFIN_TIMEOUT)
         response.raise_for_status()
     except requests.RequestException as e:
         logging.error(f'Failed to notify Jellyfin: {e}')
-        return jsonify({"success": False, "message": "Failed to scan library."}), 500
+        return False
+    return True
+
+
+def jellyfin_scan_running():
+    """Whether Jellyfin is currently scanning the library, False when it can't be asked."""
+    if not JELLYFIN_BASE_URL or not JELLYFIN_API_KEY:
+        return False
+
+    try:
+        response = requests.get(f'{JELLYFIN_BASE_URL}/ScheduledTasks/{SCAN_LIBRARY_TASK_ID}',
+                                params={'api_key': JELLYFIN_API_KEY}, timeout=JELLYFIN_TIMEOUT)
+        response.raise_for_status()
+        return response.json().get('State') == 'Running'
+    except (requests.RequestException, ValueError) as e:
+        logging.warning(f'Failed to read the Jellyfin scan state: {e}')
+        return False
+
+
+class JellyfinScanScheduler:
+    """
+    Debounces library scan requests into a single scan.
+    A scan starts once no request arrived for `quiet_period` seconds, at the latest `max_delay` seconds
+    after the first pending request. Scans run one at a time from a single worker thread, and a scan
+    still running in Jellyfin postpones the next one, so a burst of adds or subtitle downloads costs one scan.
+    """
+
+    def __init__(self, scan=notify_jellyfin, is_running=jellyfin_scan_running,
+                 quiet_period=JELLYFIN_SCAN_QUIET_PERIOD, max_delay=JELLYFIN_SCAN_MAX_DELAY):
+        self.scan = scan
+        self.is_running = is_running
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._first_request = None  # monotonic time of the oldest pending request, None when nothing is pending
+        self._due = None
+        self._worker = None
+        self.requested = 0
+        self.scans = 0
+        self.failures = 0
+        self.postponed = 0
+
+    def request_scan(self, reason=None):
+        with self._condition:
+            now = monotonic()
+            self.requested += 1
+            if self._first_request is None:
+                self._first_request = now
+            self._due = min(now + self.quiet_period, self._first_request + self.max_delay)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='jellyfin-scans', daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        if reason:
+            logging.info(f'Jellyfin library scan requested: {reason}')
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._due is None or monotonic() < self._due:
+                    self._condition.wait(None if self._due is None else self._due - monotonic())
+                self._due = None
+                self._first_request = None
+
+            if self.is_running():
+                # Keep the request pending until Jellyfin finished the scan it is running
+                with self._condition:
+                    self.postponed += 1
+                    if self._first_request is None:
+                        self._first_request = monotonic()
+                    self._due = monotonic() + self.quiet_period
+                continue
+
+            success = self.scan()
+            with self._condition:
+                self.scans += 1
+                if not success:
+                    self.failures += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'requested': self.requested,
+                'scans': self.scans,
+                'failures': self.failures,
+                'postponed': self.postponed,
+                'pending': self._due is not None
+            }
+
+
+jellyfin_scans = JellyfinScanScheduler()
@@ -0,0 +1,116 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import request, Response
+from werkzeug.wsgi import FileWrapper
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 1024 * 1024
+
+
+def send_media(path, mimetype, max_age=0):
+    """
+    Serves a file with `Range`, `If-Range`, `If-None-Match` and `ETag` support.
+    Responses reaching the end of the file are handed to the server's `wsgi.file_wrapper`
+    (direct passthrough), so gunicorn streams them with sendfile instead of copying through Python.
+    The ETag is built from size and mtime, so a file still being written changes its ETag as it grows.
+    """
+    try:
+        handle = open(path, 'rb')
+    except OSError:
+        return "File not found", 404
+
+    try:
+        stat = os.fstat(handle.fileno())
+        size = stat.st_size
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Cache-Control': f'max-age={max_age}' if max_age else 'no-cache'
+        }
+
+        if if_none_match(request.headers.get('If-None-Match'), etag):
+            handle.close()
+            return Response(status=304, headers=headers)
+
+        start, end, status = 0, size - 1, 200
+        byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range is not None and if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+            if byte_range is False:
+                handle.close()
+                return Response(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        length = max(end - start + 1, 0)
+        headers['Content-Length'] = str(length)
+        handle.seek(start)
+        if end == size - 1:
+            file_wrapper = request.environ.get('wsgi.file_wrapper', FileWrapper)
+            body = file_wrapper(handle, BLOCK_SIZE)
+        else:
+            body = read_range(handle, length)
+        return Response(body, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    except Exception:
+        handle.close()
+        raise
+
+
+def parse_range(header, size):
+    """
+    `(start, end)` of a single `bytes=` range, None when there is no usable Range header
+    (absent, malformed or several ranges, answered with the whole file) and False when it is unsatisfiable.
+    """
+    match = RANGE_PATTERN.match((header or '').strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        # Suffix range, the last n bytes
+        suffix = int(match.group(2))
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_none_match(header, etag):
+    """Whether If-None-Match lists `etag` (or `*`), compared whole and ignoring the weak `W/` prefix."""
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag.removeprefix('W/'):
+            return True
+    return False
+
+
+def if_range_matches(header, etag, mtime):
+    """A Range only applies when If-Range is absent or still names the current version of the file."""
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith('W/'):
+        return header == etag
+    try:
+        return parsedate_to_datetime(header).timestamp() >= int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def read_range(handle, length):
+    try:
+        while length > 0:
+            chunk = handle.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+
+from app.services.cache_store import cache_store
+from app.services.config import ffprobe_path, PREFERRED_AUDIO_LANGUAGES
+
+# Audio codecs every browser plays from MP4 (and HLS MPEG-TS) without transcoding
+BROWSER_AUDIO_CODECS = {'aac', 'mp3'}
+STREAM_FIELDS = ('index', 'codec_type', 'codec_name', 'profile', 'pix_fmt', 'width', 'height', 'channels',
+                 'sample_rate', 'bit_rate')
+
+
+def media_key(path):
+    """Identifies a media file by path, size and mtime, so a replaced or still growing file gets a new key."""
+    stat = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def probe_media_file(path):
+    """
+    Container and stream info of `path` from ffprobe, cached persistently per (path, size, mtime).
+    Returns a dict with `format` (name, duration, start_time, bit_rate) and `streams`
+    (codec and layout fields plus `language`, `title` and `default`).
+    Raises `OSError`, `subprocess.CalledProcessError` or `ValueError` when the file can't be probed.
+    """
+    key = media_key(path)
+    probe = cache_store.get('probe', key)
+    if probe is not None:
+        return probe
+
+    output = subprocess.run([ffprobe_path, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path],
+                            capture_output=True, check=True).stdout
+    info = json.loads(output)
+
+    media_format = info.get('format', {})
+    streams = []
+    for stream in info.get('streams', []):
+        tags = {name.lower(): value for name, value in stream.get('tags', {}).items()}
+        entry = {field: stream[field] for field in STREAM_FIELDS if field in stream}
+        entry['language'] = tags.get('language')
+        entry['title'] = tags.get('title')
+        entry['default'] = bool(stream.get('disposition', {}).get('default'))
+        streams.append(entry)
+
+    probe = {
+        'format': {
+            'name': media_format.get('format_name'),
+            'duration': float(media_format.get('duration') or 0),
+            'start_time': float(media_format.get('start_time') or 0),
+            'bit_rate': int(media_format.get('bit_rate') or 0)
+        },
+        'streams': streams
+    }
+    cache_store.set('probe', key, probe)
+    return probe
+
+
+def try_probe_media_file(path):
+    try:
+        return probe_media_file(path)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        logging.warning(f"ffprobe failed for {path}: {e}")
+        return None
+
+
+def video_stream(probe):
+    return next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'
+                 and stream.get('codec_name') not in ('mjpeg', 'png')), None)  # Skip embedded cover art
+
+
+def select_audio_stream(probe):
+    """
+    Picks the audio track to play: a preferred language first (PREFERRED_AUDIO_LANGUAGES, in order),
+    then the track flagged default, then one browsers play without transcoding, then the most channels.
+    Commentary tracks come last. Files without any tagged track still get their best remaining one,
+    None only when there is no audio at all.
+    """
+    audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
+    if not audio_streams:
+        return None
+
+    def rank(stream):
+        language = (stream.get('language') or '').lower()
+        language_rank = PREFERRED_AUDIO_LANGUAGES.index(language) if language in PREFERRED_AUDIO_LANGUAGES \
+            else len(PREFERRED_AUDIO_LANGUAGES)
+        title = (stream.get('title') or '').lower()
+        commentary = 'commentary' in title or 'description' in title
+        return (commentary, language_rank, not stream['default'],
+                stream.get('codec_name') not in BROWSER_AUDIO_CODECS, -(stream.get('channels') or 0))
+
+    return min(audio_streams, key=rank)
+
+
+def audio_arguments(stream):
+    """ffmpeg audio codec arguments for `stream`: a copy when browsers play it, stereo AAC otherwise."""
+    if stream is None or stream.get('codec_name') in BROWSER_AUDIO_CODECS:
+        return ['-c:a', 'copy']
+    arguments = ['-c:a', 'aac', '-b:a', '192k']
+    if (stream.get('channels') or 0) > 2:
+        arguments += ['-ac', '2']  # 192k is too little for 5.1, and browsers downmix to stereo anyway
+    return arguments
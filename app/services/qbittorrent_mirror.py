@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+from time import sleep
+
+import requests
+
+from app.services.config import QBITTORRENT_SYNC_INTERVAL
+
+# Fields pushed to progress subscribers, other changes (tracker counts, ratios...) are not forwarded
+PROGRESS_FIELDS = ('name', 'progress', 'dlspeed', 'upspeed', 'eta', 'state', 'size', 'amount_left', 'num_seeds')
+
+
+class QBittorrentMirror:
+    """
+    In-memory copy of qBittorrent's torrent list kept current by polling `/api/v2/sync/maindata`.
+    Only the first poll (or a resync requested by qBittorrent) transfers the full list,
+    later polls send the `rid` of the last answer and receive just the changed fields.
+    Torrents are indexed by hash and by lower-cased name, and fed to `matcher` (a `TorrentMatcher`) for fuzzy lookups.
+    Subscribers receive the progress related part of every delta, so any number of clients share this one poller.
+    """
+
+    def __init__(self, client, matcher=None, interval=QBITTORRENT_SYNC_INTERVAL):
+        self.client = client
+        self.matcher = matcher
+        self.interval = interval
+        self.rid = 0
+        self._torrents = {}  # hash -> torrent fields
+        self._names = {}  # lower-cased name -> set of hashes
+        self._lock = threading.Lock()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._synced = threading.Event()
+        self._subscribers = set()
+        self._completion_listeners = []
+        self.polls = 0
+        self.full_updates = 0
+        self.errors = 0
+
+    def ensure_started(self, wait=5):
+        """Starts the background poller on first use and waits up to `wait` seconds for the first full sync."""
+        with self._start_lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._run, name='qbittorrent-mirror', daemon=True).start()
+        return self._synced.wait(wait)
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"qBittorrent sync failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                    self.rid = 0  # Ask for a full update once qBittorrent is reachable again
+                sleep(self.interval * 5)
+                continue
+            sleep(self.interval)
+
+    def sync(self):
+        data = self.client.get("/api/v2/sync/maindata", params={'rid': self.rid}).json()
+        with self._lock:
+            self.polls += 1
+            if data.get('full_update'):
+                self.full_updates += 1
+                self._torrents.clear()
+                self._names.clear()
+                if self.matcher is not None:
+                    self.matcher.clear()
+            removed = data.get('torrents_removed', [])
+            for torrent_hash in removed:
+                self._remove(torrent_hash)
+            changed = {}
+            completed = []
+            for torrent_hash, changes in data.get('torrents', {}).items():
+                if self._completes(torrent_hash, changes) and not data.get('full_update'):
+                    completed.append(torrent_hash)
+                self._apply(torrent_hash, changes)
+                progress = {field: changes[field] for field in PROGRESS_FIELDS if field in changes}
+                if progress:
+                    changed[torrent_hash] = progress
+            self.rid = data.get('rid', 0)
+            if changed or removed or data.get('full_update'):
+                self._publish({'changed': changed, 'removed': removed, 'full_update': bool(data.get('full_update'))})
+        self._synced.set()
+        if completed:
+            for listener in self._completion_listeners:
+                try:
+                    listener(completed)
+                except Exception as e:
+                    logging.error(f"Torrent completion listener failed: {e}")
+        return data
+
+    def add_completion_listener(self, listener):
+        """Calls `listener(hashes)` from the poller thread whenever torrents finish downloading."""
+        self._completion_listeners.append(listener)
+
+    def _completes(self, torrent_hash, changes):
+        torrent = self._torrents.get(torrent_hash)
+        return torrent is not None and changes.get('progress', 0) >= 1 and torrent.get('progress', 0) < 1
+
+    def subscribe(self, maxsize=100):
+        """
+        Returns a queue receiving `{'changed': {hash: fields}, 'removed': [hashes], 'full_update': bool}` after every
+        poll that changed something. A subscriber too slow to keep up gets `{'resync': True}` instead of the backlog.
+        """
+        subscription = queue.Queue(maxsize=maxsize)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _publish(self, delta):
+        for subscription in self._subscribers:
+            try:
+                subscription.put_nowait(delta)
+            except queue.Full:
+                # Drop the backlog, the subscriber reloads the current state instead
+                try:
+                    while True:
+                        subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                subscription.put_nowait({'resync': True})
+
+    def _apply(self, torrent_hash, changes):
+        torrent = self._torrents.get(torrent_hash)
+        if torrent is None:
+            torrent = self._torrents[torrent_hash] = {'hash': torrent_hash}
+        if 'name' in changes and changes['name'] != torrent.get('name'):
+            self._unindex_name(torrent_hash, torrent.get('name'))
+            self._names.setdefault(changes['name'].lower(), set()).add(torrent_hash)
+            if self.matcher is not None:
+                self.matcher.add(torrent_hash, changes['name'])
+        torrent.update(changes)
+
+    def _remove(self, torrent_hash):
+        torrent = self._torrents.pop(torrent_hash, None)
+        if torrent is not None:
+            self._unindex_name(torrent_hash, torrent.get('name'))
+            if self.matcher is not None:
+                self.matcher.remove(torrent_hash)
+
+    def _unindex_name(self, torrent_hash, name):
+        if name is None:
+            return
+        hashes = self._names.get(name.lower())
+        if hashes is not None:
+            hashes.discard(torrent_hash)
+            if not hashes:
+                del self._names[name.lower()]
+
+    def get(self, torrent_hash):
+        with self._lock:
+            torrent = self._torrents.get(torrent_hash)
+            return dict(torrent) if torrent is not None else None
+
+    def find_by_name(self, name):
+        with self._lock:
+            return [dict(self._torrents[torrent_hash]) for torrent_hash in self._names.get(name.lower(), ())]
+
+    def names(self):
+        """Returns `(hash, name)` pairs without copying the torrents themselves."""
+        with self._lock:
+            return [(torrent_hash, torrent.get('name', '')) for torrent_hash, torrent in self._torrents.items()]
+
+    def torrents(self):
+        with self._lock:
+            return [dict(torrent) for torrent in self._torrents.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'started': self._started,
+                'torrents': len(self._torrents),
+                'rid': self.rid,
+                'subscribers': len(self._subscribers),
+                'polls': self.polls,
+                'full_updates': self.full_updates,
+                'errors': self.errors
+            }
@@ -1,162 +1,221 @@
 import threading
+from time import monotonic
 
 import requests
-from app.services.config import QBITTORRENT_BASE_URL, QBITTORRENT_USERNAME, QBITTORRENT_PASSWORD
-from app.services.jellyfin_service import notify_jellyfin
+from app.services.config import QBITTORRENT_BASE_URL, QBITTORRENT_USERNAME, QBITTORRENT_PASSWORD, QBITTORRENT_TIMEOUT
+from app.services.http_client import create_session
+from app.services.jellyfin_service import jellyfin_scans
+from app.services.qbittorrent_mirror import QBittorrentMirror
+from app.services.torrent_matcher import TorrentMatcher
 from app.services.utils import extract_season_episode, unescape_html
 from flask import jsonify
-from fuzzywuzzy import fuzz
 
 
-def add_torrent_to_qbittorrent(torrent_file, magnet_link, context, title):
-    from app.routes.torrents import qtorrent_session
-    if not QBITTORRENT_BASE_URL or not QBITTORRENT_USERNAME or not QBITTORRENT_PASSWORD:
-        print("qBittorrent credentials not set.")
-        return False
+class QBittorrentClient:
+    """
+    qBittorrent Web API client owning its session cookie and connection pool.
+    Calls are sent straight away; only when qBittorrent answers 403 (expired or missing session)
+    the client logs in again and retries once. Concurrent re-logins are serialized into a single login.
+    """
+
+    def __init__(self, base_url, username, password, pool_size=8, timeout=QBITTORRENT_TIMEOUT):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = create_session(pool_size=pool_size, retries=2)
+        self._login_lock = threading.Lock()
+        self._login_generation = 0
+        self._stats_lock = threading.Lock()
+        self._latencies = {}  # path -> [calls, total seconds]
+        self.logins = 0
+        self.errors = 0
+
+    def configured(self):
+        return bool(self.base_url and self.username and self.password)
+
+    def login(self):
+        try:
+            response = self.session.post(f"{self.base_url}/api/v2/auth/login", timeout=self.timeout,
+                                         data={'username': self.username, 'password': self.password})
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Error logging in: {e}")
+            return False
 
-    if not is_session_valid():
-        if not login_to_qbittorrent():
-            print("Failed to login to qBittorrent.")
+        if response.text != "Ok.":
+            print(f"Failed to log in: {response.text}")
             return False
+        with self._stats_lock:
+            self.logins += 1
+        return True
 
-    add_torrent_url = f"{QBITTORRENT_BASE_URL}/api/v2/torrents/add"
-    title = unescape_html(title)
+    def _relogin(self, failed_generation):
+        with self._login_lock:
+            # Another request already logged in again while this one was waiting for the lock
+            if self._login_generation != failed_generation:
+                return True
+            if not self.login():
+                return False
+            self._login_generation += 1
+            return True
+
+    def _send(self, method, path, **kwargs):
+        started = monotonic()
+        try:
+            return self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                latency = self._latencies.setdefault(path, [0, 0.0])
+                latency[0] += 1
+                latency[1] += monotonic() - started
+
+    def request(self, method, path, **kwargs):
+        """Sends an API call, logging in again and retrying once on 403. Raises `requests.RequestException`."""
+        generation = self._login_generation
+        response = self._send(method, path, **kwargs)
+        if response.status_code == 403 and self._relogin(generation):
+            response = self._send(method, path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'logins': self.logins,
+                'errors': self.errors,
+                'calls': {path: {'count': count, 'average_latency': round(total / count, 3)}
+                          for path, (count, total) in self._latencies.items()}
+            }
+
+
+qbittorrent = QBittorrentClient(QBITTORRENT_BASE_URL, QBITTORRENT_USERNAME, QBITTORRENT_PASSWORD)
+torrent_matcher = TorrentMatcher()
+qbittorrent_mirror = QBittorrentMirror(qbittorrent, torrent_matcher)
+qbittorrent_mirror.add_completion_listener(
+    lambda hashes: jellyfin_scans.request_scan(f"{len(hashes)} torrent(s) finished downloading"))
+
+
+def add_torrent_to_qbittorrent(torrent_file, magnet_link, context, title):
+    if not qbittorrent.configured():
+        print("qBittorrent credentials not set.")
+        return False
 
     files = None
-    data = {}
+    data = torrent_add_options(context, title)
     if magnet_link is not None:
-        data = {'urls': magnet_link, 'sequentialDownload': 'true', 'firstLastPiecePrio': 'true',
-                'savepath': f'{context}/{title}'}
+        data['urls'] = magnet_link
     if torrent_file is not None:
-        files = {'torrents': (torrent_file.filename, torrent_file.stream, torrent_file.mimetype)}
-        data = {'sequentialDownload': 'true', 'firstLastPiecePrio': 'true',
-                'savepath': f'{context}/{title}'}
+        # Read the upload once so the request can be replayed after a re-login
+        files = {'torrents': (torrent_file.filename, torrent_file.stream.read(), torrent_file.mimetype)}
 
     try:
-        if files is not None:
-            response = qtorrent_session.post(add_torrent_url, data=data, files=files)
-        else:
-            response = qtorrent_session.post(add_torrent_url, data=data)
-
-        response.raise_for_status()
-
-        threading.Timer(5, notify_jellyfin).start()
+        qbittorrent.post("/api/v2/torrents/add", data=data, files=files)
 
+        torrents_added(title)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Error adding torrent: {e}")
         return False
 
 
-def is_session_valid():
-    from app.routes.torrents import qtorrent_session
-    try:
-        test_url = f"{QBITTORRENT_BASE_URL}/api/v2/auth/login"
-        response = qtorrent_session.get(test_url)
-        response.raise_for_status()
-        if response.text != "Ok.":
-            raise Exception("Session is not valid.")
+def add_magnets_to_qbittorrent(magnet_links, context, title):
+    """
+    Adds several magnets saved under the same `context/title` folder with a single `torrents/add` call,
+    qBittorrent accepts newline separated urls. Returns False when qBittorrent rejected the whole batch.
+    """
+    if not qbittorrent.configured():
+        print("qBittorrent credentials not set.")
+        return False
+
+    if not magnet_links:
         return True
+
+    data = torrent_add_options(context, title)
+    data['urls'] = '\n'.join(magnet_links)
+    try:
+        response = qbittorrent.post("/api/v2/torrents/add", data=data)
     except requests.exceptions.RequestException as e:
-        print(f"Error adding torrent: {e}")
+        print(f"Error adding torrents: {e}")
         return False
 
+    # 'Fails.' means none of the urls could be added
+    if response.text.strip() == 'Fails.':
+        print(f"qBittorrent rejected {len(magnet_links)} torrents for {title}")
+        return False
 
-def login_to_qbittorrent():
-    from app.routes.torrents import qtorrent_session
-    login_url = f"{QBITTORRENT_BASE_URL}/api/v2/auth/login"
-    data = {
-        'username': QBITTORRENT_USERNAME,
-        'password': QBITTORRENT_PASSWORD
-    }
-    try:
-        response = qtorrent_session.post(login_url, data=data)
-        response.raise_for_status()
+    torrents_added(title)
+    return True
 
-        if response.text != "Ok.":
-            print(f"Failed to log in: {response.text}")
-            raise Exception("Failed to login to qBittorrent")
 
-        # Print cookies to ensure session is set
-        print(f"Login successful, session cookies: {qtorrent_session.cookies}")
-        return True
-    except requests.exceptions.RequestException as e:
-        print(f"Error logging in: {e}")
-        return False
+def torrents_added(title):
+    # Sequential downloads are playable early, so the library picks the new files up right away (debounced),
+    # and the mirror is started to rescan once they finish
+    jellyfin_scans.request_scan(f"torrent added for {title}")
+    qbittorrent_mirror.ensure_started(wait=0)
+
+
+def torrent_add_options(context, title):
+    return {'sequentialDownload': 'true', 'firstLastPiecePrio': 'true',
+            'savepath': f'{context}/{unescape_html(title)}'}
 
 
 def get_torrent_by_title(title):
-    from app.routes.torrents import qtorrent_session
-    if not QBITTORRENT_BASE_URL or not QBITTORRENT_USERNAME or not QBITTORRENT_PASSWORD:
+    if not qbittorrent.configured():
         print("qBittorrent credentials not set.")
         return jsonify({'error': 'qBittorrent credentials not set.'}), 400
 
-    if not is_session_valid():
-        if not login_to_qbittorrent():
-            print("Failed to login to qBittorrent.")
-            return jsonify({'error': 'Failed to login to qBittorrent.'}), 500
-    print("title ", title)
-
     if not title:
         return jsonify({'error': 'No title provided.'}), 400
 
-    torrents_info_url = f"{QBITTORRENT_BASE_URL}/api/v2/torrents/info"
-    try:
-
-        response = qtorrent_session.get(torrents_info_url)
-        response.raise_for_status()
-        torrents = response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching torrents: {e}")
+    # Lookups are served from the local mirror, qBittorrent only sees small delta polls
+    if not qbittorrent_mirror.ensure_started():
+        print("qBittorrent torrent list is not available yet.")
         return jsonify({'error': 'Error fetching torrents.'}), 500
 
-    best_match = None
-    highest_similarity = 0
-
-    season, episode = extract_season_episode(title)
-
-    for torrent in torrents:
-        torrent_name = torrent['name']
-        similarity = fuzz.ratio(torrent_name, title)
+    torrent_hash = find_torrent_hash(title)
+    torrent = qbittorrent_mirror.get(torrent_hash) if torrent_hash else None
+    if torrent:
+        return torrent
+    else:
+        return jsonify({'error': 'No matching torrent found.'}), 404
 
-        if season and episode:
-            season_episode_pattern = f"s{season}e{episode}"
-            if season_episode_pattern.lower() not in torrent_name.lower():
-                continue
 
-        if similarity > highest_similarity:
-            highest_similarity = similarity
-            best_match = torrent
+def find_torrent_hash(title):
+    """Returns the hash of the mirrored torrent named `title`, or of the closest fuzzy match, None if there is none."""
+    exact_matches = qbittorrent_mirror.find_by_name(title)
+    if exact_matches:
+        return exact_matches[0]['hash']
 
-    if best_match:
-        return best_match
-    else:
-        return jsonify({'error': 'No matching torrent found.'}), 404
+    season, episode = extract_season_episode(title)
+    best_match = torrent_matcher.best_match(title, season, episode)
+    return best_match[0] if best_match else None
 
 
 def get_media_file_name(torrent_hash):
-    from app.routes.torrents import qtorrent_session
-    if not QBITTORRENT_BASE_URL or not QBITTORRENT_USERNAME or not QBITTORRENT_PASSWORD:
+    if not qbittorrent.configured():
         print("qBittorrent credentials not set.")
         return jsonify({'error': 'qBittorrent credentials not set.'}), 400
 
-    if not is_session_valid():
-        if not login_to_qbittorrent():
-            print("Failed to login to qBittorrent.")
-            return jsonify({'error': 'Failed to login to qBittorrent.'}), 500
-
     if not torrent_hash:
         return jsonify({'error': 'No hash provided.'}), 400
 
     try:
-        torrents_files_url = f"{QBITTORRENT_BASE_URL}/api/v2/torrents/files?hash={torrent_hash}"
-
-        response = qtorrent_session.get(torrents_files_url)
+        response = qbittorrent.get("/api/v2/torrents/files", params={'hash': torrent_hash})
         largest_file = max(response.json(), key=lambda file: file['size'])
         largest_file_name = largest_file['name']
         if '/' in largest_file_name:
             largest_file_name = largest_file_name.rsplit('/', 1)[-1]
-        response.raise_for_status()
     except requests.RequestException as e:
         print(f"Error fetching torrents: {e}")
         return jsonify({'error': 'Error fetching torrent files.'}), 500
@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+
+RESOLUTION_PATTERN = re.compile(r'\b(2160p|1080p|720p|576p|480p|4k|uhd)\b', re.IGNORECASE)
+CODEC_PATTERN = re.compile(r'\b(x264|h\.?264|avc|x265|h\.?265|hevc|av1|xvid|divx)\b', re.IGNORECASE)
+SOURCE_PATTERN = re.compile(r'\b(blu-?ray|bdrip|brrip|web-?dl|web-?rip|web|hdtv|dvdrip|hdrip|hdcam|cam|telesync|ts)\b',
+                            re.IGNORECASE)
+HDR_PATTERN = re.compile(r'\b(hdr10\+|hdr10plus|hdr10|hdr|dolby[ .]?vision|dovi|dv)(?![a-z0-9])', re.IGNORECASE)
+REMUX_PATTERN = re.compile(r'\bremux\b', re.IGNORECASE)
+EPISODE_PATTERN = re.compile(r'\bs(\d{1,2})[ .]?e(\d{1,3})\b', re.IGNORECASE)
+SEASON_PATTERN = re.compile(r'\b(?:s(\d{1,2})|season[ .]?(\d{1,2}))\b', re.IGNORECASE)
+# The last '-GROUP' of the name, except the second half of a source such as WEB-DL, WEB-Rip or Blu-Ray
+GROUP_PATTERN = re.compile(r'(?<!web)(?<!blu)-([a-z0-9]+)$', re.IGNORECASE)
+# Extensions and trailing tracker tags such as '[eztv]' or '[rarbg]' that follow the group
+TRAILER_PATTERN = re.compile(r'(?:\.(?:mkv|mp4|avi)|\s*\[[^\]]*\])+$', re.IGNORECASE)
+SIZE_PATTERN = re.compile(r'([\d.,]+)\s*([kmgt]?i?b)\b', re.IGNORECASE)
+
+RESOLUTIONS = {'4k': '2160p', 'uhd': '2160p'}
+CODECS = {'x264': 'h264', 'h264': 'h264', 'h.264': 'h264', 'avc': 'h264',
+          'x265': 'hevc', 'h265': 'hevc', 'h.265': 'hevc', 'hevc': 'hevc'}
+SOURCES = {'bluray': 'bluray', 'blu-ray': 'bluray', 'bdrip': 'bluray', 'brrip': 'bluray', 'web-dl': 'web-dl',
+           'webdl': 'web-dl', 'web': 'web-dl', 'web-rip': 'webrip', 'hdcam': 'cam', 'telesync': 'cam', 'ts': 'cam'}
+HDR_FORMATS = {'hdr10+': 'HDR10+', 'hdr10plus': 'HDR10+', 'hdr10': 'HDR10', 'hdr': 'HDR', 'dovi': 'DV', 'dv': 'DV'}
+SIZE_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'tb': 1024 ** 4}
+
+# Higher is better, used by the 'quality' ranking
+RESOLUTION_RANK = {'2160p': 5, '1080p': 4, '720p': 3, '576p': 2, '480p': 1}
+SOURCE_RANK = {'remux': 6, 'bluray': 5, 'web-dl': 4, 'webrip': 3, 'hdtv': 2, 'hdrip': 1, 'dvdrip': 1, 'cam': -10}
+
+
+@lru_cache(maxsize=8192)
+def parse_release_name(title):
+    """
+    Extracts quality metadata from a scene style release name, e.g. 'Show.S01E02.2160p.WEB-DL.DV.HDR.H.265-GRP'.
+    Results are memoized, the same names come back on every search.
+    Returns a dict with `resolution`, `codec`, `source`, `hdr`, `season`, `episode` and `group` (None when absent).
+    """
+    resolution = RESOLUTION_PATTERN.search(title)
+    codec = CODEC_PATTERN.search(title)
+    source = SOURCE_PATTERN.search(title)
+    hdr = HDR_PATTERN.findall(title)
+    group = GROUP_PATTERN.search(TRAILER_PATTERN.sub('', title.strip()))
+
+    season, episode = None, None
+    episode_match = EPISODE_PATTERN.search(title)
+    if episode_match:
+        season, episode = int(episode_match.group(1)), int(episode_match.group(2))
+    else:
+        season_match = SEASON_PATTERN.search(title)
+        if season_match:
+            season = int(season_match.group(1) or season_match.group(2))
+
+    source = 'remux' if REMUX_PATTERN.search(title) else source.group(1) if source else None
+    hdr_formats = []
+    for hdr_format in hdr:
+        hdr_format = HDR_FORMATS.get(hdr_format.lower(), 'DV')
+        if hdr_format not in hdr_formats:
+            hdr_formats.append(hdr_format)
+
+    return {
+        'resolution': normalize_resolution(resolution.group(1)) if resolution else None,
+        'codec': normalize_codec(codec.group(1)) if codec else None,
+        'source': normalize_source(source) if source else None,
+        'hdr': '/'.join(hdr_formats) or None,
+        'season': season,
+        'episode': episode,
+        'group': group.group(1) if group else None
+    }
+
+
+def normalize_resolution(resolution):
+    """Canonical resolution of a parsed name or a filter value, e.g. '4K' -> '2160p'."""
+    resolution = resolution.lower()
+    return RESOLUTIONS.get(resolution, resolution)
+
+
+def normalize_codec(codec):
+    """Canonical codec, e.g. 'x265' or 'H.265' -> 'hevc'."""
+    codec = codec.lower()
+    return CODECS.get(codec, codec)
+
+
+def normalize_source(source):
+    """Canonical source, e.g. 'BluRay' -> 'bluray', 'WEB' -> 'web-dl'."""
+    source = source.lower()
+    return SOURCES.get(source, source)
+
+
+def parse_size(size):
+    """Converts a size string such as '1.4 GB' or '700 MiB' to bytes, 0 if it can't be parsed."""
+    match = SIZE_PATTERN.search(size or '')
+    if not match:
+        return 0
+    unit = match.group(2).lower().replace('i', '')
+    try:
+        return int(float(match.group(1).replace(',', '')) * SIZE_UNITS.get(unit, 1))
+    except ValueError:
+        return 0
+
+
+def quality_rank(release):
+    return RESOLUTION_RANK.get(release['resolution'], 0), SOURCE_RANK.get(release['source'], 0), bool(release['hdr'])
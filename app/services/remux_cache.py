@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+from time import time, sleep
+
+from app.services.ffmpeg_manager import ffmpeg_manager
+from app.services.probe_service import media_key
+
+# A partial file nobody wrote to for this long is left over from a crashed or restarted worker
+STALE_PART_SECONDS = 10 * 60
+# Remuxes finished or served this recently are kept even above the cap, a viewer is likely still reading them
+RECENT_SECONDS = 60
+
+
+class RemuxJob:
+    """One ffmpeg remux writing `part_path`, renamed to `path` when it succeeds."""
+
+    def __init__(self, path, part_path):
+        self.path = path
+        self.part_path = part_path
+        self.done = threading.Event()
+        self.failed = False
+
+    def available(self):
+        """Bytes written so far, the readable file and whether it is complete."""
+        if self.done.is_set():
+            if self.failed:
+                return 0, None, True
+            try:
+                return os.path.getsize(self.path), self.path, True
+            except FileNotFoundError:
+                return 0, None, True
+        try:
+            return os.path.getsize(self.part_path), self.part_path, False
+        except FileNotFoundError:
+            # Renamed between the two checks
+            return self.available() if self.done.wait(1) else (0, None, False)
+
+
+class RemuxCache:
+    """
+    Disk cache of fragmented MP4 remuxes keyed by the source (path, size, mtime).
+    A remux is started once per source file, concurrent viewers share it and can read
+    the fragments already written while ffmpeg is still running. Finished files are reused
+    until the source changes, the least recently served ones are removed above `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes, build_command):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.build_command = build_command
+        self._jobs = {}  # cache key -> running RemuxJob
+        # Path -> last time served. The files' mtime is left alone (it is part of their ETag), it only orders
+        # remuxes not served since startup
+        self._served = {}
+        self._lock = threading.RLock()  # get() re-checks the cache while holding it
+        self.hits = 0
+        self.remuxes = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def enabled(self):
+        return bool(self.directory and self.max_bytes > 0)
+
+    def get(self, source):
+        """
+        Returns the `RemuxJob` of `source`, finished when the remux is cached already, started otherwise.
+        Raises `FfmpegBusyError` when no ffmpeg slot frees up in time and `OSError` when ffmpeg can't be started.
+        """
+        key = media_key(source)
+        path = os.path.join(self.directory, f"{key}.mp4")
+        job = self._cached(key, path)
+        if job is not None:
+            return job
+
+        # Wait for a slot without holding the lock, then check again: another request may have started the remux
+        slot = ffmpeg_manager.reserve()
+        try:
+            with self._lock:
+                job = self._cached(key, path)
+                if job is not None:
+                    return job
+
+                os.makedirs(self.directory, exist_ok=True)
+                job = RemuxJob(path, os.path.join(self.directory, f"{key}.{os.getpid()}.part"))
+                session = ffmpeg_manager.start(self.build_command(source, job.part_path), 'remux', slot=slot)
+                slot = None
+                self._jobs[key] = job
+                self.remuxes += 1
+        finally:
+            if slot is not None:
+                slot.release()
+
+        threading.Thread(target=self._wait, args=(key, job, session), name=f'remux-{key[:8]}', daemon=True).start()
+        return job
+
+    def _cached(self, key, path):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self.hits += 1
+                return job
+
+            if os.path.exists(path):
+                self.hits += 1
+                self._served[path] = time()
+                job = RemuxJob(path, None)
+                job.done.set()
+                return job
+        return None
+
+    def _wait(self, key, job, session):
+        returncode = session.wait()
+        try:
+            if returncode == 0:
+                os.replace(job.part_path, job.path)
+            else:
+                logging.error(f"Remux to {job.path} failed: {session.stderr_tail()}")
+                job.failed = True
+                os.remove(job.part_path)
+        except OSError as e:
+            logging.error(f"Failed to finish remux {job.path}: {e}")
+            job.failed = True
+        finally:
+            with self._lock:
+                self._jobs.pop(key, None)
+                if job.failed:
+                    self.failures += 1
+            job.done.set()
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently served remuxes until the cache fits in `max_bytes`."""
+        with self._lock:
+            active = {job.part_path for job in self._jobs.values()}
+            files = []
+            try:
+                entries = list(os.scandir(self.directory))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.part'):
+                    if entry.path not in active and time() - stat.st_mtime > STALE_PART_SECONDS:
+                        self._remove(entry.path)
+                    elif entry.path in active:
+                        files.append((float('inf'), stat.st_size, None))  # Counts towards the cap, never evicted
+                elif entry.name.endswith('.mp4'):
+                    files.append((max(stat.st_mtime, self._served.get(entry.path, 0)), stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in files)
+            for modified, size, path in sorted(files, key=lambda item: item[0]):
+                if total <= self.max_bytes or path is None or time() - modified < RECENT_SECONDS:
+                    break
+                if self._remove(path):
+                    self.evictions += 1
+                    total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            self._served.pop(path, None)
+            return True
+        except OSError as e:
+            logging.warning(f"Failed to remove cached remux {path}: {e}")
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': len(self._jobs),
+                'hits': self.hits,
+                'remuxes': self.remuxes,
+                'failures': self.failures,
+                'evictions': self.evictions
+            }
+
+
+def tail_file(job, start, end=None, chunk_size=256 * 1024, poll_interval=0.25):
+    """
+    Yields the bytes of `job`'s file from `start`, waiting for ffmpeg to write more until the remux
+    is done (or `end`, inclusive, is reached).
+    """
+    position = start
+    handle, handle_path = None, None
+    try:
+        while end is None or position <= end:
+            available, path, complete = job.available()
+            if path is None:
+                return
+            if path != handle_path:
+                # The part file was renamed to the finished file, reopen it at the same position
+                if handle is not None:
+                    handle.close()
+                handle, handle_path = open(path, 'rb'), path
+                handle.seek(position)
+            if position >= available:
+                if complete:
+                    return
+                sleep(poll_interval)
+                continue
+            limit = available if end is None else min(available, end + 1)
+            chunk = handle.read(min(chunk_size, limit - position))
+            if not chunk:
+                continue
+            position += len(chunk)
+            yield chunk
+    finally:
+        if handle is not None:
+            handle.close()
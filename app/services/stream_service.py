@@ -1,9 +1,19 @@
 import logging
 import os
+import re
 import subprocess
+from time import monotonic, sleep
 
-from flask import request, Response, send_file
-from app.services.config import MEDIA_EXTENSIONS, ffmpeg_path
+from flask import request, Response
+from app.services.config import MEDIA_EXTENSIONS, ffmpeg_path, REMUX_CACHE_DIR, REMUX_CACHE_MAX_BYTES, \
+    REMUX_RANGE_WAIT, TORRENT_STREAM_WAIT
+from app.services.ffmpeg_manager import ffmpeg_manager, FfmpegBusyError, iter_stdout, feed_stdin
+from app.services.media_response import send_media, parse_range
+from app.services.probe_service import try_probe_media_file, video_stream, select_audio_stream, audio_arguments
+from app.services.remux_cache import RemuxCache, tail_file
+from app.services.torrent_stream import iter_torrent_file, wait_for_pieces
+
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d*)$')
 
 
 def find_media_files(directory_path, context, season_episode=None, follow_symlinks=False):
@@ -53,7 +63,11 @@ def find_media_files(directory_path, context, season_episode=None, follow_symlin
     return media_files
 
 
-def stream_and_remux(torrent_title):
+def stream_and_remux(torrent_title, torrent_file=None):
+    """
+    Pipes an MKV remuxed to MP4 straight from ffmpeg (no seeking).
+    A `torrent_file` that is still downloading is fed to ffmpeg's stdin piece by piece as qBittorrent completes them.
+    """
     media_file_path = request.args.get('file')
     if not os.path.exists(media_file_path):
         logging.error("Torrent file not found")
@@ -61,44 +75,165 @@ def stream_and_remux(torrent_title):
 
     logging.info("Torrent file found")
     # FFmpeg command to transcode and stream the video
-    ffmpeg_command = [
-        ffmpeg_path,
-        '-i', media_file_path,
-        '-c:v', 'copy',  # Copy the video codec (no re-encoding)
-        '-map', '0:v:0',  # Select the first video stream
-        '-map', '0:a:m:language:eng',  # Select the audio stream with language "eng"
-        '-c:a', 'aac',  # Encode audio to AAC if necessary
-        '-b:a', '192k',  # Set the audio bitrate
-        '-preset', 'ultrafast',  # Use ultrafast preset for quicker encoding
-        '-tune', 'fastdecode',  # Tune for faster decoding (useful for streaming)
-        '-movflags', 'frag_keyframe+empty_moov',  # Optimize for streaming
-        '-f', 'mp4',  # Output format
-        'pipe:1'  # Streaming to stdout
-    ]
+    if torrent_file is not None:
+        ffmpeg_command = remux_command(media_file_path, 'pipe:1', input_url='pipe:0')
+    else:
+        ffmpeg_command = remux_command(media_file_path, 'pipe:1')
 
     # Start FFmpeg process
     try:
-        ffmpeg_process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        session = ffmpeg_manager.start(ffmpeg_command, 'remux-pipe', stdout=subprocess.PIPE,
+                                       stdin=subprocess.PIPE if torrent_file is not None else subprocess.DEVNULL)
         logging.info("ffmpeg process started")
+        if torrent_file is not None:
+            feed_stdin(session, iter_torrent_file(torrent_file, media_file_path, 0, torrent_file.size - 1),
+                       torrent_file.size)
+    except FfmpegBusyError as e:
+        logging.warning(f"Remux of {media_file_path} rejected: {e}")
+        return Response("Too many streams running, try again shortly", 503, headers={'Retry-After': '5'})
     except Exception as e:
         logging.error(f"ffmpeg process failed: {e}")
         return "FFmpeg not found. Please ensure FFmpeg is installed and accessible.", 500
 
-    # Stream the output of FFmpeg to the client
-    return Response(ffmpeg_process.stdout, mimetype='video/mp4')
+    # Stream the output of FFmpeg to the client, ffmpeg is stopped when the client goes away
+    return Response(iter_stdout(session), mimetype='video/mp4')
+
+
+def remux_command(media_file_path, output, input_url=None):
+    """
+    ffmpeg arguments remuxing `media_file_path` to fragmented MP4, built from its cached ffprobe info.
+    Video is always copied. The best audio track (see `select_audio_stream`) is copied when browsers play it
+    and only transcoded to AAC otherwise, so most files stream with a pure container copy.
+    `input_url` makes ffmpeg read the file from elsewhere (e.g. `pipe:0`) while still probing `media_file_path`.
+    """
+    probe = try_probe_media_file(media_file_path)
+    if probe is not None:
+        video, audio = video_stream(probe), select_audio_stream(probe)
+        maps = ['-map', f"0:{video['index']}" if video else '0:v:0?']
+        if audio is not None:
+            maps += ['-map', f"0:{audio['index']}"]
+        codecs = ['-c:v', 'copy', *audio_arguments(audio)]
+        if video and video.get('codec_name') == 'hevc':
+            codecs += ['-tag:v', 'hvc1']  # Safari only plays HEVC in MP4 tagged hvc1
+    else:
+        # Unknown streams, keep the first video and audio track and make sure the audio plays
+        maps = ['-map', '0:v:0?', '-map', '0:a:0?']
+        codecs = ['-c:v', 'copy', '-c:a', 'aac', '-b:a', '192k']
+
+    return [
+        ffmpeg_path,
+        '-i', input_url or media_file_path,
+        *maps,
+        *codecs,
+        '-sn',  # Subtitles are served separately as VTT
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',  # Fragments are playable while being written
+        '-f', 'mp4',  # Output format
+        '-y', output
+    ]
+
 
+remux_cache = RemuxCache(REMUX_CACHE_DIR, REMUX_CACHE_MAX_BYTES, remux_command)
 
-def stream_mp4(torrent_title):
+
+def stream_cached_remux(torrent_title):
+    """
+    Serves an MKV remuxed to fragmented MP4 through the remux cache, with HTTP Range support.
+    While the remux is running a range is answered with the bytes written so far (`Content-Range: bytes a-b/*`),
+    a range beyond them waits up to REMUX_RANGE_WAIT seconds for ffmpeg to get there.
+    """
+    media_file_path = request.args.get('file')
+    if not media_file_path or not os.path.exists(media_file_path):
+        logging.error(f"File not found: {media_file_path}")
+        return "File not found", 404
+
+    try:
+        job = remux_cache.get(media_file_path)
+    except FfmpegBusyError as e:
+        logging.warning(f"Remux of {media_file_path} rejected: {e}")
+        return Response("Too many streams running, try again shortly", 503, headers={'Retry-After': '5'})
+    except OSError as e:
+        logging.error(f"ffmpeg process failed: {e}")
+        return "FFmpeg not found. Please ensure FFmpeg is installed and accessible.", 500
+
+    # A remux that just started may not have created its part file yet, wait for ffmpeg's first bytes
+    deadline = monotonic() + REMUX_RANGE_WAIT
+    available, path, complete = job.available()
+    while path is None and not complete and monotonic() < deadline:
+        sleep(0.25)
+        available, path, complete = job.available()
+
+    if complete and not job.failed:
+        return send_media(job.path, "video/mp4")
+    if path is None:
+        logging.warning(f"Remux of {media_file_path} {'failed' if job.failed else 'did not start in time'}")
+        return Response("Remux is not available yet, try again shortly", 503, headers={'Retry-After': '5'})
+
+    range_match = RANGE_PATTERN.match(request.headers.get('Range', '').strip())
+    if not range_match:
+        return Response(tail_file(job, 0), mimetype='video/mp4', headers={'Accept-Ranges': 'bytes'})
+
+    start = int(range_match.group(1))
+    if range_match.group(2) and int(range_match.group(2)) < start:
+        return Response(status=416, headers={'Accept-Ranges': 'bytes'})
+    while available <= start and not complete and monotonic() < deadline:
+        sleep(0.25)
+        available, path, complete = job.available()
+
+    if complete:
+        if job.failed:
+            return "Failed to remux file", 500
+        return send_media(job.path, "video/mp4")
+    if available <= start:
+        return Response("Remux has not reached the requested range yet", 503, headers={'Retry-After': '2'})
+
+    end = available - 1
+    if range_match.group(2):
+        end = min(end, int(range_match.group(2)))
+    return Response(tail_file(job, start, end), 206, mimetype='video/mp4', headers={
+        'Accept-Ranges': 'bytes',
+        'Content-Range': f'bytes {start}-{end}/*',
+        'Content-Length': str(end - start + 1)
+    })
+
+
+def stream_mp4(torrent_title, torrent_file=None):
     media_file_path = request.args.get('file')
 
     if not media_file_path or not os.path.exists(media_file_path):
         logging.error(f"File not found: {media_file_path}")
         return "File not found", 404
 
+    if torrent_file is not None:
+        logging.info(f"Serving MP4 file while it downloads: {media_file_path}")
+        return stream_downloading_file(media_file_path, torrent_file, "video/mp4")
+
     logging.info(f"Serving MP4 file: {media_file_path}")
 
-    return send_file(
-        media_file_path,
-        mimetype="video/mp4",
-        as_attachment=False
-    )
\ No newline at end of file
+    return send_media(media_file_path, "video/mp4")
+
+
+def stream_downloading_file(media_file_path, torrent_file, mimetype):
+    """
+    Serves a file qBittorrent is still downloading, with HTTP Range support against its final size.
+    Only downloaded pieces are read: the response waits up to TORRENT_STREAM_WAIT seconds for the first piece
+    of the range (503 with Retry-After otherwise) and then for every following piece as the player reads on.
+    """
+    size = torrent_file.size
+    start, end, status = 0, size - 1, 200
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'no-cache'}
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        return Response(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+    if byte_range is not None:
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    first_piece = torrent_file.piece_at(start)
+    if not wait_for_pieces(torrent_file, first_piece, first_piece, timeout=TORRENT_STREAM_WAIT):
+        return Response("The requested range has not been downloaded yet", 503, headers={'Retry-After': '5'})
+
+    headers['Content-Length'] = str(end - start + 1)
+    return Response(iter_torrent_file(torrent_file, media_file_path, start, end), status=status, mimetype=mimetype,
+                    headers=headers, direct_passthrough=True)
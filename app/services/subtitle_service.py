@@ -3,32 +3,42 @@ import os
 import re
 import subprocess
 import threading
-from json import load
-from os import path
-from time import time
 
 import pysubs2
 import requests
 
 import app.services.config as config
-from app.services.config import WIZDOM_DOMAIN, TMP_DIR, TMDB_KEY
-from app.services.utils import normalize_str
-
-
-def caching_json(filename, url):
-    json_file = path.join(TMP_DIR, filename)
-    if not path.exists(json_file) or path.getsize(json_file) <= 20 or (time() - path.getmtime(json_file) > 30 * 60):
-        logging.debug(f"Fetching data from URL: {url}")
-        response = requests.get(url)
-        response.encoding = 'utf-8'
-        with open(json_file, 'w', encoding='utf-8') as f:
-            f.write(response.text)
+from app.services.cache_store import cache_store
+from app.services.config import WIZDOM_DOMAIN
+from app.services.singleflight import SingleFlight
+
+
+json_flight = SingleFlight('json')
+
+
+def caching_json(filename, url, http_get=requests.get):
+    # Entries are grouped by the first two dotted parts of the name (e.g. 'wizdom.imdb'), each group has its own TTL
+    namespace = '.'.join(filename.split('.')[:2])
+    data = cache_store.get(namespace, filename)
+    if data is None:
+        data = json_flight.do(filename, lambda: fetch_json(namespace, filename, url, http_get))
+    return data
+
+
+def fetch_json(namespace, key, url, http_get):
+    logging.debug(f"Fetching data from URL: {url}")
+    response = http_get(url)
+    response.encoding = 'utf-8'
     try:
-        with open(json_file, 'r', encoding='utf-8') as json_data:
-            return load(json_data)
-    except UnicodeDecodeError as e:
-        logging.error(f"UnicodeDecodeError: {e}")
-    return {}
+        data = response.json()
+    except ValueError as e:
+        logging.error(f"Invalid JSON from {url}: {e}")
+        return {}
+
+    # Near empty answers are not worth keeping, they are retried on the next call
+    if len(response.text) > 20:
+        cache_store.set(namespace, key, data)
+    return data
 
 
 def convert_srt_to_vtt(srt_path, vtt_path):
@@ -56,29 +66,6 @@ def search_by_imdb(imdb_id, season=0, episode=0, version=0):
     return caching_json(filename, url)
 
 
-def search_tmdb(media_type, query, year=None):
-    normalized_query = normalize_str(query.replace('&amp;', '&'))
-    filename = f'wizdom.search.tmdb.{media_type}.{normalized_query}.{year}.json'
-    url = (f"https://api.tmdb.org/3/search/{media_type}?api_key={TMDB_KEY}&query={normalized_query}"
-           f"&year={year or ''}").rstrip('&year=')
-
-    json_data = caching_json(filename, url)
-    try:
-        results = json_data.get("results", [])
-        if results:
-            filtered_results = [result for result in results if
-                                result.get('name' if media_type == 'tv' else 'title', '').lower() == query.lower()]
-            if filtered_results:
-                most_popular = sorted(filtered_results, key=lambda x: x.get('popularity', 0), reverse=True)[0]
-                tmdb_id = most_popular["id"]
-                external_url = f"https://api.tmdb.org/3/{media_type}/{tmdb_id}/external_ids?api_key={TMDB_KEY}"
-                external_data = requests.get(external_url).json()
-                return external_data.get("imdb_id")
-    except (IndexError, KeyError) as e:
-        logging.error(f"Error extracting TMDB ID: {e}")
-    return None
-
-
 def get_first_subtitle_track(mkv_file):
     """Finds the first subtitle track ID in an MKV file."""
     result = subprocess.run(["mkvmerge", "-i", mkv_file], capture_output=True, text=True)
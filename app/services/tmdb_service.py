@@ -1,12 +1,70 @@
 import logging
-
-import requests
-
-from app.services.config import TMDB_BASE_URL, TMDB_KEY, MOVIE_GENRE_MAP, TV_GENRE_MAP, NETWORK_ID_MAP
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.config import TMDB_BASE_URL, TMDB_KEY, MOVIE_GENRE_MAP, TV_GENRE_MAP, NETWORK_ID_MAP, \
+    TMDB_SESSION_ID, TMDB_POOL_SIZE, TMDB_RETRIES, TMDB_RETRY_BACKOFF, TMDB_TIMEOUT, TMDB_LIST_TTLS, \
+    TMDB_CACHE_MAX_ENTRIES, TMDB_SHOW_TTL
+from app.services.cache import TTLCache
+from app.services.http_client import create_session
+from app.services.singleflight import SingleFlight
 from app.services.subtitle_service import caching_json
 from app.services.utils import normalize_str
 
-tmdb_session = requests.Session()
+# Shared keep-alive client, every TMDB call must go through it to reuse pooled TLS connections
+tmdb_session = create_session(pool_size=TMDB_POOL_SIZE, retries=TMDB_RETRIES, backoff=TMDB_RETRY_BACKOFF)
+tmdb_flight = SingleFlight('tmdb')
+tmdb_list_cache = TTLCache('tmdb_lists', max_entries=TMDB_CACHE_MAX_ENTRIES)
+tmdb_show_cache = TTLCache('tmdb_shows', max_entries=TMDB_CACHE_MAX_ENTRIES)
+# Movie titles seen in listings and searches, lets a detail page start its torrent search before TMDB answers
+tmdb_title_index = TTLCache('tmdb_titles', max_entries=TMDB_CACHE_MAX_ENTRIES * 20, max_stale=0)
+tmdb_executor = ThreadPoolExecutor(max_workers=TMDB_POOL_SIZE, thread_name_prefix='tmdb')
+
+# TMDB accepts at most 20 sub-requests in a single append_to_response
+TMDB_APPEND_LIMIT = 20
+
+
+def tmdb_get(url, params=None, timeout=TMDB_TIMEOUT):
+    # Identical concurrent requests (e.g. several tabs on the same page) share a single upstream call
+    key = (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+    return tmdb_flight.do(key, lambda: tmdb_session.get(url, params=params, timeout=timeout))
+
+
+def fetch_list(url, params):
+    response = tmdb_get(url, params)
+    if response.status_code != 200:
+        print(f"Error: Unable to fetch {url} from TMDb. Status code: {response.status_code}")
+        return None
+    data = response.json()
+    total_pages = data.get('total_pages', 1)
+    remember_movie_titles(data['results'])
+    return data['results'], total_pages
+
+
+def remember_movie_titles(results):
+    for result in results:
+        if result.get('id') and result.get('title'):
+            tmdb_title_index.set(result['id'], (result['title'], result.get('release_date')), ttl=TMDB_SHOW_TTL)
+
+
+def peek_movie_title(movie_id):
+    """
+    Returns the `(title, release_date)` of a movie already seen in a listing, or None.
+    Peeks so detail pages of movies never listed don't count as misses in the cache stats.
+    """
+    return tmdb_title_index.peek(movie_id)
+
+
+def get_cached_list(list_type, url, params):
+    """
+    Fetches a TMDB listing page through the stale-while-revalidate list cache.
+    - `list_type`: Key of `TMDB_LIST_TTLS` deciding how long the page stays fresh.
+    Returns a `(results, total_pages)` tuple, `([], 1)` if TMDB could not be reached.
+    """
+    key = (url, params.get('page'), tuple(sorted((k, str(v)) for k, v in params.items() if k != 'api_key')))
+    result = tmdb_list_cache.get_or_fetch(key, lambda: fetch_list(url, params), ttl=TMDB_LIST_TTLS[list_type])
+    if result is None:
+        return [], 1
+    return result
 
 
 def get_popular_bluray_movies(page):
@@ -17,10 +75,7 @@ def get_popular_bluray_movies(page):
         'with_release_type': 5,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('popular', url, params)
 
 
 def get_top_rated_movies(page):
@@ -29,10 +84,7 @@ def get_top_rated_movies(page):
         'api_key': TMDB_KEY,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('top_rated', url, params)
 
 
 def get_trending_movies(page):
@@ -41,38 +93,27 @@ def get_trending_movies(page):
         'api_key': TMDB_KEY,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('trending', url, params)
 
 
 def get_movie_watchlist(page):
-    session_id = tmdb_session.get('tmdb_session_id')
     url = f'{TMDB_BASE_URL}/account/21427229/watchlist/movies?language=en-US&page=1&sort_by=created_at.asc'
     params = {
         'api_key': TMDB_KEY,
         'page': page,
-        'session_id': session_id
+        'session_id': TMDB_SESSION_ID
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('watchlist', url, params)
 
 
 def get_tv_watchlist(page):
-    session_id = tmdb_session.get('tmdb_session_id')
     url = f'{TMDB_BASE_URL}/account/21427229/watchlist/tv?language=en-US&page=1&sort_by=created_at.asc'
     params = {
         'api_key': TMDB_KEY,
         'page': page,
-        'session_id': session_id
+        'session_id': TMDB_SESSION_ID
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('watchlist', url, params)
 
 
 def get_trending_shows(page):
@@ -81,10 +122,7 @@ def get_trending_shows(page):
         'api_key': TMDB_KEY,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('trending', url, params)
 
 
 def get_popular_running_shows(page):
@@ -93,10 +131,7 @@ def get_popular_running_shows(page):
         'api_key': TMDB_KEY,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('popular', url, params)
 
 
 def get_top_rated_shows(page):
@@ -105,33 +140,71 @@ def get_top_rated_shows(page):
         'api_key': TMDB_KEY,
         'page': page
     }
-    response = requests.get(url, params=params)
-    data = response.json()
-    total_pages = data.get('total_pages', 1)
-    return data['results'], total_pages
+    return get_cached_list('top_rated', url, params)
 
 
-def get_movie_details(movie_id):
+def get_movie_details(movie_id, with_credits=False):
     url = f"{TMDB_BASE_URL}/movie/{movie_id}"
     params = {'api_key': TMDB_KEY}
-    response = requests.get(url, params=params)
+    if with_credits:
+        params['append_to_response'] = 'credits'
+    response = tmdb_get(url, params)
     return response.json()
 
 
 def get_movie_credits(movie_id):
     credits_url = f"{TMDB_BASE_URL}/movie/{movie_id}/credits"
     params = {'api_key': TMDB_KEY}
-    credits_response = requests.get(credits_url, params=params)
+    credits_response = tmdb_get(credits_url, params)
     return credits_response.json()
 
 
 def get_tv_show_details(show_id):
     url = f"{TMDB_BASE_URL}/tv/{show_id}?append_to_response=credits"
     params = {'api_key': TMDB_KEY}
-    response = requests.get(url, params=params)
+    response = tmdb_get(url, params)
     return response.json()
 
 
+def get_tv_show_with_seasons(show_id):
+    """
+    Returns the show details (with credits) where every season carries an `episodes` list of episode numbers.
+    The assembled show is cached per show for `TMDB_SHOW_TTL` seconds, `{}` is returned when TMDB fails.
+    """
+    return tmdb_show_cache.get_or_fetch(show_id, lambda: fetch_tv_show_with_seasons(show_id), ttl=TMDB_SHOW_TTL) or {}
+
+
+def fetch_tv_show_with_seasons(show_id):
+    url = f"{TMDB_BASE_URL}/tv/{show_id}"
+
+    # Speculatively append the first seasons to the details call, most shows are complete after this single request
+    first_batch = [f'season/{number}' for number in range(1, TMDB_APPEND_LIMIT)]
+    response = tmdb_get(url, {'api_key': TMDB_KEY, 'append_to_response': ','.join(['credits'] + first_batch)})
+    if response.status_code != 200:
+        print(f"Error: Unable to fetch TV show {show_id} from TMDb. Status code: {response.status_code}")
+        return None
+    show_data = response.json()
+
+    season_numbers = [season.get('season_number') for season in show_data.get('seasons', [])]
+    missing = [f'season/{number}' for number in season_numbers
+               if number != 0 and f'season/{number}' not in show_data]
+
+    # Leftover seasons of long running shows are fetched in groups of 20, all groups at once
+    groups = [missing[i:i + TMDB_APPEND_LIMIT] for i in range(0, len(missing), TMDB_APPEND_LIMIT)]
+    futures = [tmdb_executor.submit(tmdb_get, url, {'api_key': TMDB_KEY, 'append_to_response': ','.join(group)})
+               for group in groups]
+    for future in futures:
+        group_response = future.result()
+        if group_response.status_code == 200:
+            show_data.update(group_response.json())
+
+    for season in show_data.get('seasons', []):
+        season_data = show_data.pop(f"season/{season.get('season_number')}", None) or {}
+        season['episodes'] = [episode['episode_number'] for episode in season_data.get('episodes', [])]
+
+    return show_data
+
+
 def search_movies_by_name(query, page):
     url = f'https://api.themoviedb.org/3/search/movie'
     params = {
@@ -141,10 +214,12 @@ def search_movies_by_name(query, page):
         'page': page,
         'include_adult': True
     }
-    response = requests.get(url, params=params)
+    response = tmdb_get(url, params)
 
     if response.status_code == 200:
-        return response.json()
+        data = response.json()
+        remember_movie_titles(data.get('results', []))
+        return data
     else:
         print(f"Error: Unable to fetch movies from TMDb. Status code: {response.status_code}")
         return []
@@ -159,7 +234,7 @@ def search_tv_shows_by_name(query, page):
         'page': page,
         'include_adult': True
     }
-    response = requests.get(url, params=params)
+    response = tmdb_get(url, params)
 
     if response.status_code == 200:
         return response.json()
@@ -174,7 +249,7 @@ def search_tmdb(media_type, query, year=None):
     url = (f"https://api.tmdb.org/3/search/{media_type}?api_key={TMDB_KEY}&query={normalized_query}"
            f"&year={year or ''}").rstrip('&year=')
 
-    json_data = caching_json(filename, url)
+    json_data = caching_json(filename, url, http_get=tmdb_get)
     try:
         results = json_data.get("results", [])
         if results:
@@ -184,7 +259,7 @@ def search_tmdb(media_type, query, year=None):
                 most_popular = sorted(filtered_results, key=lambda x: x.get('popularity', 0), reverse=True)[0]
                 tmdb_id = most_popular["id"]
                 external_url = f"https://api.tmdb.org/3/{media_type}/{tmdb_id}/external_ids?api_key={TMDB_KEY}"
-                external_data = requests.get(external_url).json()
+                external_data = tmdb_get(external_url).json()
                 return external_data.get("imdb_id")
     except (IndexError, KeyError) as e:
         logging.error(f"Error extracting TMDB ID: {e}")
@@ -227,15 +302,7 @@ def advanced_search(args, context):
         }
 
     params.update({k: v for k, v in optional_params.items() if v is not None})
-    response = requests.get(url, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-        total_pages = data.get('total_pages', 1)
-        return data['results'], total_pages
-    else:
-        print(f"Error: Unable to fetch TV shows from TMDb. Status code: {response.status_code}")
-        return [], 1
+    return get_cached_list('discover', url, params)
 
 
 def map_to_list(str_list, id_map):
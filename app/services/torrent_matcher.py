@@ -0,0 +1,104 @@
+import re
+import threading
+from collections import Counter
+
+from rapidfuzz import fuzz, process
+
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+# Every 'sXXeYY' substring, overlapping ones included, the same test as `pattern in name.lower()`
+EPISODE_KEYS = re.compile(r'(?=(s\d{2}e\d{2}))')
+
+
+def normalize_name(name):
+    return ' '.join(NON_ALPHANUMERIC.split(name.lower())).strip()
+
+
+def trigrams(normalized):
+    padded = f' {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TorrentMatcher:
+    """
+    Fuzzy title -> torrent lookup over an incrementally maintained index.
+    Names are normalized and split into trigrams once when added. A lookup narrows the candidates
+    with the season/episode key and the trigram index, then scores only that shortlist with rapidfuzz.
+    """
+
+    def __init__(self, shortlist_size=64):
+        self.shortlist_size = shortlist_size
+        self._names = {}  # hash -> original name
+        self._grams = {}  # hash -> trigrams of the normalized name
+        self._postings = {}  # trigram -> hashes
+        self._episodes = {}  # 'sXXeYY' -> hashes
+        self._lock = threading.Lock()
+
+    def add(self, torrent_hash, name):
+        with self._lock:
+            self._discard(torrent_hash)
+            grams = trigrams(normalize_name(name))
+            self._names[torrent_hash] = name
+            self._grams[torrent_hash] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(torrent_hash)
+            for key in set(EPISODE_KEYS.findall(name.lower())):
+                self._episodes.setdefault(key, set()).add(torrent_hash)
+
+    def remove(self, torrent_hash):
+        with self._lock:
+            self._discard(torrent_hash)
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._grams.clear()
+            self._postings.clear()
+            self._episodes.clear()
+
+    def _discard(self, torrent_hash):
+        name = self._names.pop(torrent_hash, None)
+        if name is None:
+            return
+        for gram in self._grams.pop(torrent_hash):
+            hashes = self._postings[gram]
+            hashes.discard(torrent_hash)
+            if not hashes:
+                del self._postings[gram]
+        for key in set(EPISODE_KEYS.findall(name.lower())):
+            hashes = self._episodes[key]
+            hashes.discard(torrent_hash)
+            if not hashes:
+                del self._episodes[key]
+
+    def best_match(self, title, season=None, episode=None):
+        """
+        Returns `(hash, similarity)` of the torrent whose name is closest to `title`, or None.
+        When `season` and `episode` are given only names containing 'sXXeYY' are considered.
+        """
+        with self._lock:
+            if season and episode:
+                allowed = self._episodes.get(f"s{season}e{episode}".lower(), set())
+            else:
+                allowed = None
+
+            overlap = Counter()
+            for gram in trigrams(normalize_name(title)):
+                hashes = self._postings.get(gram)
+                if hashes:
+                    overlap.update(hashes if allowed is None else hashes & allowed)
+
+            if overlap:
+                shortlist = [torrent_hash for torrent_hash, _ in overlap.most_common(self.shortlist_size)]
+            else:
+                shortlist = list(self._names if allowed is None else allowed)
+            choices = {torrent_hash: self._names[torrent_hash] for torrent_hash in shortlist}
+
+        if not choices:
+            return None
+        match = process.extractOne(title, choices, scorer=fuzz.ratio)
+        if match is None or match[1] <= 0:
+            return None
+        return match[2], match[1]
+
+    def __len__(self):
+        return len(self._names)
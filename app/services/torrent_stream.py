@@ -0,0 +1,167 @@
+import logging
+import threading
+from time import monotonic, sleep
+
+import requests
+
+from app.services.cache import TTLCache
+from app.services.config import TORRENT_STREAM_WAIT, TORRENT_STREAM_POLL_INTERVAL
+from app.services.qbittorrent_service import qbittorrent, qbittorrent_mirror
+from app.services.singleflight import SingleFlight
+
+# qBittorrent piece states
+PIECE_DOWNLOADED = 2
+# qBittorrent's highest file priority
+MAXIMUM_PRIORITY = 7
+READ_BLOCK_SIZE = 1024 * 1024
+
+torrent_layout_cache = TTLCache('torrent_layouts', max_entries=256, max_stale=0)
+piece_states_cache = TTLCache('torrent_piece_states', max_entries=64, max_stale=0)
+piece_states_flight = SingleFlight('torrent_piece_states')
+_prioritized = set()  # (hash, file index) already raised to the maximum priority
+_prioritized_lock = threading.Lock()
+
+
+class TorrentFile:
+    """Where a file lives inside its torrent: its byte offset in the torrent's piece space and the piece size."""
+
+    def __init__(self, torrent_hash, index, size, offset, piece_size):
+        self.hash = torrent_hash
+        self.index = index
+        self.size = size
+        self.offset = offset
+        self.piece_size = piece_size
+
+    def piece_at(self, position):
+        """The piece holding byte `position` of the file."""
+        return (self.offset + position) // self.piece_size
+
+    def piece_end(self, piece):
+        """The last byte of the file inside `piece`."""
+        return min((piece + 1) * self.piece_size - self.offset, self.size) - 1
+
+
+def normalize_path(path):
+    return path.replace('\\', '/').rstrip('/')
+
+
+def locate_downloading_file(media_file_path):
+    """
+    Returns the `TorrentFile` of `media_file_path` when it belongs to a torrent qBittorrent is still downloading,
+    None when the torrent is complete or unknown.
+    qBittorrent may see the downloads under another mount point, files are matched on their path inside the torrent.
+    Never waits for the mirror: until its first sync every file is treated as downloaded.
+    """
+    if not media_file_path or not qbittorrent.configured() or not qbittorrent_mirror.ensure_started(wait=0):
+        return None
+
+    path = normalize_path(media_file_path)
+    for torrent in qbittorrent_mirror.torrents():
+        if torrent.get('progress', 0) >= 1:
+            continue
+        content_name = normalize_path(torrent.get('content_path') or torrent.get('name') or '').rsplit('/', 1)[-1]
+        if not content_name or not (path.endswith('/' + content_name) or f'/{content_name}/' in path):
+            continue
+
+        try:
+            layout = torrent_layout_cache.get_or_fetch(
+                torrent['hash'], lambda: fetch_torrent_layout(torrent['hash']), ttl=5 * 60)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logging.error(f"Failed to read the layout of torrent {torrent['hash']}: {e}")
+            continue
+        if not layout:
+            continue
+
+        offset = 0
+        for file in layout['files']:
+            piece_size = layout['piece_size']
+            first_piece = file['piece_range'][0] if file['piece_range'] else offset // piece_size
+            if not first_piece * piece_size <= offset < (first_piece + 1) * piece_size:
+                # Pad files (BEP 47) and v2 torrents start files on a piece boundary, and qBittorrent doesn't
+                # list pad files, so the running sum of the sizes falls short of the real offset
+                offset = first_piece * piece_size
+            if path.endswith('/' + normalize_path(file['name'])):
+                return TorrentFile(torrent['hash'], file['index'], file['size'], offset, piece_size)
+            offset += file['size']
+    return None
+
+
+def fetch_torrent_layout(torrent_hash):
+    """
+    The piece size and the files (in torrent order, with their `[first, last]` piece range) of a torrent,
+    None while its metadata is unknown.
+    """
+    properties = qbittorrent.get("/api/v2/torrents/properties", params={'hash': torrent_hash}).json()
+    files = qbittorrent.get("/api/v2/torrents/files", params={'hash': torrent_hash}).json()
+    if not properties.get('piece_size') or not files:
+        return None
+    return {
+        'piece_size': properties['piece_size'],
+        'files': [{'index': file.get('index', position), 'name': file['name'], 'size': file['size'],
+                   'piece_range': file.get('piece_range')}
+                  for position, file in enumerate(files)]
+    }
+
+
+def piece_states(torrent_hash):
+    """qBittorrent's state of every piece, shared by all readers of the torrent for a poll interval."""
+    return piece_states_cache.get_or_fetch(
+        torrent_hash,
+        lambda: piece_states_flight.do(torrent_hash, lambda: qbittorrent.get(
+            "/api/v2/torrents/pieceStates", params={'hash': torrent_hash}).json()),
+        ttl=TORRENT_STREAM_POLL_INTERVAL)
+
+
+def prioritize(torrent_file):
+    """Raises the file to qBittorrent's maximum priority once, so the pieces a viewer waits for come first."""
+    key = (torrent_file.hash, torrent_file.index)
+    with _prioritized_lock:
+        if key in _prioritized:
+            return
+        _prioritized.add(key)
+    try:
+        qbittorrent.post("/api/v2/torrents/filePrio",
+                         data={'hash': torrent_file.hash, 'id': torrent_file.index, 'priority': MAXIMUM_PRIORITY})
+    except requests.RequestException as e:
+        logging.warning(f"Failed to raise the priority of {torrent_file.hash} file {torrent_file.index}: {e}")
+        with _prioritized_lock:
+            _prioritized.discard(key)
+
+
+def wait_for_pieces(torrent_file, first, last, timeout=TORRENT_STREAM_WAIT):
+    """Waits until pieces `first`..`last` are downloaded, False if that takes longer than `timeout` seconds."""
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            states = piece_states(torrent_file.hash)
+            if all(state == PIECE_DOWNLOADED for state in states[first:last + 1]):
+                return True
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"Failed to read the pieces of {torrent_file.hash}: {e}")
+        prioritize(torrent_file)
+        if monotonic() >= deadline:
+            return False
+        sleep(TORRENT_STREAM_POLL_INTERVAL)
+
+
+def iter_torrent_file(torrent_file, path, start, end):
+    """
+    Yields bytes `start`..`end` (inclusive) of a file that is still downloading, one piece at a time.
+    Each piece is read only once qBittorrent has it, so the reader never sees unwritten data; a slow swarm
+    slows the response down instead (backpressure). Stops early when a piece doesn't arrive in time.
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        position = start
+        while position <= end:
+            piece = torrent_file.piece_at(position)
+            if not wait_for_pieces(torrent_file, piece, piece):
+                logging.warning(f"Piece {piece} of {torrent_file.hash} did not arrive in time, ending the stream")
+                return
+            piece_end = min(torrent_file.piece_end(piece), end)
+            while position <= piece_end:
+                chunk = handle.read(min(READ_BLOCK_SIZE, piece_end - position + 1))
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
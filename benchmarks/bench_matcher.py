@@ -0,0 +1,87 @@
+"""
+Compares the indexed TorrentMatcher with the previous full scan of get_torrent_by_title
+(a Python loop scoring every torrent name, season/episode filter applied after scoring).
+
+Usage: python -m benchmarks.bench_matcher [torrents] [queries]
+"""
+import random
+import sys
+from time import perf_counter
+
+from rapidfuzz import fuzz
+
+from app.services.torrent_matcher import TorrentMatcher
+from app.services.utils import extract_season_episode
+
+WORDS = ['the', 'last', 'night', 'house', 'dragon', 'dark', 'city', 'blue', 'river', 'king', 'empire', 'lost',
+         'star', 'winter', 'office', 'breaking', 'bad', 'better', 'call', 'saul', 'true', 'detective', 'crown',
+         'wire', 'bear', 'severance', 'andor', 'mandalorian', 'succession', 'fargo', 'dune', 'heat', 'arrival']
+QUALITY = ['1080p.WEB-DL.DDP5.1.H.264', '2160p.WEB-DL.DV.HDR.H.265', '720p.HDTV.x264', '1080p.BluRay.x264',
+           '2160p.BluRay.REMUX.HEVC']
+GROUPS = ['NTb', 'FLUX', 'SPARKS', 'GalaxyTV', 'EDITH', 'RARBG', 'playWEB']
+
+
+def synthetic_names(count, rng):
+    names = []
+    for _ in range(count):
+        title = '.'.join(word.capitalize() for word in rng.sample(WORDS, rng.randint(1, 4)))
+        if rng.random() < 0.7:
+            tag = f"S{rng.randint(1, 12):02d}E{rng.randint(1, 24):02d}"
+        else:
+            tag = str(rng.randint(1970, 2025))
+        names.append(f"{title}.{tag}.{rng.choice(QUALITY)}-{rng.choice(GROUPS)}")
+    return names
+
+
+def full_scan(torrents, title):
+    best_match = None
+    highest_similarity = 0
+    season, episode = extract_season_episode(title)
+    for torrent_hash, torrent_name in torrents:
+        similarity = fuzz.ratio(torrent_name, title)
+        if season and episode:
+            if f"s{season}e{episode}" not in torrent_name.lower():
+                continue
+        if similarity > highest_similarity:
+            highest_similarity = similarity
+            best_match = torrent_hash
+    return best_match
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(42)
+
+    torrents = [(f"{index:040x}", name) for index, name in enumerate(synthetic_names(count, rng))]
+    # Queries are existing names with the separators and quality tags a user would not type
+    queries = [name.split('.1080p')[0].split('.2160p')[0].split('.720p')[0].replace('.', ' ')
+               for _, name in rng.sample(torrents, query_count)]
+
+    started = perf_counter()
+    matcher = TorrentMatcher()
+    for torrent_hash, name in torrents:
+        matcher.add(torrent_hash, name)
+    index_time = perf_counter() - started
+
+    started = perf_counter()
+    expected = [full_scan(torrents, query) for query in queries]
+    scan_time = perf_counter() - started
+
+    started = perf_counter()
+    found = []
+    for query in queries:
+        season, episode = extract_season_episode(query)
+        match = matcher.best_match(query, season, episode)
+        found.append(match[0] if match else None)
+    matcher_time = perf_counter() - started
+
+    agreement = sum(1 for a, b in zip(expected, found) if a == b) / len(queries)
+    print(f"{count} torrents, {query_count} queries, index built in {index_time * 1000:.0f} ms")
+    print(f"full scan {scan_time / query_count * 1000:8.3f} ms/query")
+    print(f"matcher   {matcher_time / query_count * 1000:8.3f} ms/query   x{scan_time / matcher_time:.1f}")
+    print(f"same best match as the full scan for {agreement:.0%} of the queries")
+
+
+if __name__ == '__main__':
+    main()
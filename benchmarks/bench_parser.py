@@ -0,0 +1,74 @@
+"""
+Compares the lxml torrent results parser and the magnet scan against the previous BeautifulSoup implementation.
+
+Usage: python -m benchmarks.bench_parser [iterations]
+The bundled fixtures in benchmarks/fixtures (*_synthetic.html) are generated pages following rargb's markup
+(repeated result rows, placeholder uploaders and filler info rows), not recorded ones, so the speedups are
+measured on synthetic markup. Drop recorded pages there (rargb_search*.html / rargb_torrent*.html)
+to benchmark them too.
+"""
+import glob
+import os
+import sys
+from timeit import timeit
+
+from bs4 import BeautifulSoup
+
+from app.services.config import RARBG_BASE_URL
+from app.services.indexers.base import torrent_row
+from app.services.indexers.rargb import EXCLUDED_CATEGORIES, find_magnet, parse_html
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def parse_html_bs4(html):
+    """The BeautifulSoup parser this benchmark measures against."""
+    soup = BeautifulSoup(html, 'lxml')
+    torrents = []
+
+    for row in soup.select("table.lista2t > tr.lista2"):
+        columns = row.select("td")
+        if len(columns) > 6:
+            title_column = columns[1].select_one("a")
+            if title_column:
+                category = columns[2].text.strip()
+                if category in EXCLUDED_CATEGORIES:
+                    continue
+                torrents.append(torrent_row('rargb', title_column.text, RARBG_BASE_URL + title_column['href'],
+                                            category, columns[4].text, columns[5].text, columns[6].text,
+                                            columns[3].text))
+
+    return torrents
+
+
+def find_magnet_bs4(html):
+    magnet_tag = BeautifulSoup(html, 'lxml').select_one('a[href^="magnet:?"]')
+    return magnet_tag.get('href') if magnet_tag else None
+
+
+def load_fixtures(prefix):
+    fixtures = {}
+    for fixture in sorted(glob.glob(os.path.join(FIXTURES_DIR, f'{prefix}*.html'))):
+        with open(fixture, encoding='utf-8') as f:
+            fixtures[os.path.basename(fixture)] = f.read()
+    return fixtures
+
+
+def compare(label, fixtures, current, previous, iterations):
+    for name, html in fixtures.items():
+        if current(html) != previous(html):
+            raise AssertionError(f"{label}: output differs from BeautifulSoup on {name}")
+        current_time = timeit(lambda: current(html), number=iterations) / iterations * 1000
+        previous_time = timeit(lambda: previous(html), number=iterations) / iterations * 1000
+        print(f"{label:<8} {name:<28} bs4 {previous_time:8.3f} ms   new {current_time:8.3f} ms   "
+              f"x{previous_time / current_time:.1f}")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    compare('results', load_fixtures('rargb_search'), parse_html, parse_html_bs4, iterations)
+    compare('magnet', load_fixtures('rargb_torrent'), find_magnet, find_magnet_bs4, iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Production server settings: `gunicorn -c gunicorn.conf.py run:app`.
+
+Threaded workers (gthread) fit the app: long media responses park a thread, not a process, and file
+responses go out through sendfile without holding the GIL. Each worker process has its own qBittorrent
+mirror, caches, Jellyfin scan scheduler and ffmpeg cap, so scale threads first and add workers sparingly.
+"""
+import os
+
+from app.services.config import TMP_DIR, SUBS_DIR
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8888')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+# Streams stay open for the length of a movie; with gthread the timeout only watches the worker's heartbeat
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+sendfile = True
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    os.makedirs(TMP_DIR, exist_ok=True)
+    os.makedirs(SUBS_DIR, exist_ok=True)